@@ -7,16 +7,45 @@
 """
 
 import os
-import json
-import base64
+import sys
+import gzip
+import shutil
 import argparse
-from io import BytesIO
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-import pandas as pd
-from datasets import Dataset
-from PIL import Image
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pybase64
+from datasets import Dataset, Image as ImageFeature, Value
 from loguru import logger
 
+# 每次从Arrow表中读取的行数
+ARROW_BATCH_SIZE = 256
+
+# JSONL写缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 20
+
+# --compress 时的gzip压缩级别，1级速度最快
+GZIP_COMPRESS_LEVEL = 1
+
+# 每个行分片的最少行数：每个分片都要在spawn子进程中重新导入依赖并重新加载数据集，
+# 行数不足时在当前进程中转换更快
+MIN_ROWS_PER_SHARD = 5000
+
+# 保存图片文件的线程数，以及等待图片保存完成的最大行数
+IMAGE_SAVE_WORKERS = 8
+MAX_PENDING_ROWS = 32
+
+# 转换子进程的日志格式
+WORKER_LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{process.name}</cyan> - <level>{message}</level>"
+)
+
 
 def get_project_root():
     """
@@ -25,87 +54,153 @@ def get_project_root():
     return Path(__file__).parent.absolute()
 
 
-def image_to_base64(image):
+def is_null(value):
     """
-    将PIL Image对象转换为base64编码的字符串
+    判断值是否为空（None或NaN），按类型判断，不依赖pd.isna的异常分支
     """
-    if not isinstance(image, Image.Image):
-        return None
+    return value is None or (isinstance(value, float) and value != value)
 
-    buffer = BytesIO()
-    image.save(buffer, format='PNG')
-    img_bytes = buffer.getvalue()
-    buffer.close()
 
-    return base64.b64encode(img_bytes).decode('utf-8')
+def is_datadreamer_image_format(value):
+    """
+    检测是否是DataDreamer的图片格式：{"bytes": b'...', "path": "..."}
+    """
+    return (isinstance(value, dict) and
+            "bytes" in value and
+            isinstance(value["bytes"], bytes) and
+            len(value["bytes"]) > 100)  # 图片二进制数据通常很长
 
 
-def save_image_to_file(image, image_dir, row_idx, col_name, img_counter):
+def sniff_image_extension(img_bytes):
     """
-    将PIL Image保存为文件
+    根据文件头判断已编码图片的格式，返回文件扩展名
+    """
+    if img_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if img_bytes[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if img_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def save_image_bytes_to_file(img_bytes, image_dir, row_idx, col_name, img_counter, extension=None):
+    """
+    将已编码的图片二进制数据直接写入文件，不经过PIL解码再编码
 
     Args:
-        image: PIL Image对象
+        img_bytes: 已编码的图片二进制数据
         image_dir: 图片保存目录
         row_idx: 数据行号
         col_name: 列名
         img_counter: 图片计数器（用于同一行同一列有多个图片的情况）
+        extension: 已判断出的文件扩展名，未提供时根据文件头判断
 
     Returns:
         str: 图片文件的相对路径
     """
-    if not isinstance(image, Image.Image):
-        return None
+    # 生成图片文件名：row_{行号}_{列名}_{计数器}.{原始格式}（图片目录由调用方预先创建）
+    if extension is None:
+        extension = sniff_image_extension(img_bytes)
+    filename = f"row_{row_idx:06d}_{col_name}_{img_counter:03d}.{extension}"
+    with open(os.path.join(image_dir, filename), 'wb') as f:
+        f.write(img_bytes)
 
-    # 确保图片目录存在
-    image_dir.mkdir(exist_ok=True)
+    # 返回相对路径（相对于数据集目录）
+    return f"images/{filename}"
 
-    # 生成图片文件名：row_{行号}_{列名}_{计数器}.png
-    filename = f"row_{row_idx:06d}_{col_name}_{img_counter:03d}.png"
-    filepath = image_dir / filename
 
-    # 保存图片
-    image.save(filepath, format='PNG')
+class ImageSaveQueue:
+    """
+    在线程池中保存图片文件（PIL编码和文件写入都会释放GIL）
+    图片路径在对应行写出JSON之前通过resolve()回填
+    """
 
-    # 返回相对路径（相对于数据集目录）
-    return f"images/{filename}"
+    def __init__(self, executor):
+        self.executor = executor
+        self.pending = []
 
+    def submit(self, result, save_fn, *args):
+        self.pending.append((result, self.executor.submit(save_fn, *args)))
 
-def is_datadreamer_image_format(value):
+    def take_pending(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    @staticmethod
+    def resolve(pending):
+        for result, future in pending:
+            image_path = future.result()
+            if image_path:
+                result["file_path"] = image_path
+
+
+def store_image(result, save_fn, image, image_dir, row_idx, col_name, img_counter_dict, save_queue=None):
     """
-    检测是否是DataDreamer的图片格式：{"bytes": b'...', "path": "..."}
+    更新图片计数器并保存图片；提供save_queue时提交到线程池异步保存
     """
-    return (isinstance(value, dict) and
-            "bytes" in value and
-            isinstance(value["bytes"], bytes) and
-            len(value["bytes"]) > 100)  # 图片二进制数据通常很长
+    # 获取当前列的图片计数器
+    key = (row_idx, col_name)
+    img_counter_dict[key] += 1
+
+    if save_queue is not None:
+        save_queue.submit(result, save_fn, image, image_dir, row_idx, col_name, img_counter_dict[key])
+        return
+
+    # 保存图片文件
+    image_path = save_fn(image, image_dir, row_idx, col_name, img_counter_dict[key])
+
+    if image_path:
+        result["file_path"] = image_path
+        # 逐图片日志降为debug并延迟格式化，进度在每100行的检查点统一输出
+        logger.debug("保存图片: {} (第{}行, 列'{}')", image_path, row_idx + 1, col_name)
 
 
-def bytes_to_image(img_bytes):
+def process_datadreamer_image(value, image_dir=None, row_idx=None, col_name=None, img_counter_dict=None,
+                              save_queue=None, base64_data=None):
     """
-    将二进制数据转换为PIL Image对象
+    处理DataDreamer的图片格式：{"bytes": b'...', "path": "..."}
+    返回base64数据，并在提供图片保存参数时直接写入原始图片文件
+    已按列批量编码过的base64数据可通过base64_data传入
     """
-    try:
-        img_buffer = BytesIO(img_bytes)
-        return Image.open(img_buffer)
-    except Exception as e:
-        logger.error(f"无法解码二进制图片数据: {e}")
-        return None
+    img_bytes = value["bytes"]
+    extension = sniff_image_extension(img_bytes)
+
+    # 将二进制数据转换为base64用于JSON存储
+    if base64_data is None:
+        base64_data = pybase64.b64encode_as_string(img_bytes)
+
+    result = {
+        "type": "image",
+        "format": f"base64_{extension}",
+        "data": base64_data
+    }
+
+    # 如果提供了图片保存参数，则直接写入原始图片数据
+    if image_dir is not None and row_idx is not None and col_name is not None:
+        store_image(result, partial(save_image_bytes_to_file, extension=extension), img_bytes,
+                    image_dir, row_idx, col_name, img_counter_dict, save_queue)
+
+    return result
 
 
-def process_value(value, image_dir=None, row_idx=None, col_name=None, img_counter_dict=None):
+def process_value(value, image_dir=None, row_idx=None, col_name=None, img_counter_dict=None,
+                  save_queue=None):
     """
     处理不同类型的数据值，确保可以进行JSON序列化
-    支持DataDreamer的图片格式和PIL Image对象
+    支持DataDreamer的图片格式（数据集以Arrow格式读取，图片始终是{"bytes", "path"}，不会是PIL Image）
 
     Args:
         value: 要处理的值
         image_dir: 图片保存目录
         row_idx: 当前行号
         col_name: 当前列名
-        img_counter_dict: 图片计数器字典（用于跟踪每列的图片数量）
+        img_counter_dict: 图片计数器（defaultdict(int)，键为(行号, 列名)）
+        save_queue: 可选的ImageSaveQueue，提供时图片文件在线程池中异步保存
     """
-    if value is None:
+    if is_null(value):
         return None
 
     if hasattr(value, 'tolist'):
@@ -116,89 +211,226 @@ def process_value(value, image_dir=None, row_idx=None, col_name=None, img_counte
 
     # 处理DataDreamer的图片格式：{"bytes": b'...', "path": "..."}
     if is_datadreamer_image_format(value):
-        img_bytes = value["bytes"]
-
-        # 将二进制数据转换为base64用于JSON存储
-        base64_data = base64.b64encode(img_bytes).decode('utf-8')
-
-        result = {
-            "type": "image",
-            "format": "base64_png",
-            "data": base64_data
-        }
-
-        # 如果提供了图片保存参数，则同时保存图片文件
-        if image_dir is not None and row_idx is not None and col_name is not None:
-            # 将二进制数据转换为PIL Image
-            pil_image = bytes_to_image(img_bytes)
-
-            if pil_image:
-                # 获取当前列的图片计数器
-                key = f"{row_idx}_{col_name}"
-                if key not in img_counter_dict:
-                    img_counter_dict[key] = 0
-                img_counter_dict[key] += 1
-
-                # 保存图片文件
-                image_path = save_image_to_file(
-                    pil_image, image_dir, row_idx, col_name, img_counter_dict[key]
-                )
-
-                if image_path:
-                    result["file_path"] = image_path
-                    logger.info(f"保存图片: {image_path} (第{row_idx + 1}行, 列'{col_name}')")
-
-        return result
-
-    # 处理直接的PIL Image对象
-    elif isinstance(value, Image.Image):
-        result = {
-            "type": "image",
-            "format": "base64_png",
-            "data": image_to_base64(value)
-        }
-
-        # 如果提供了图片保存参数，则同时保存图片文件
-        if image_dir is not None and row_idx is not None and col_name is not None:
-            # 获取当前列的图片计数器
-            key = f"{row_idx}_{col_name}"
-            if key not in img_counter_dict:
-                img_counter_dict[key] = 0
-            img_counter_dict[key] += 1
-
-            # 保存图片文件
-            image_path = save_image_to_file(
-                value, image_dir, row_idx, col_name, img_counter_dict[key]
-            )
-
-            if image_path:
-                result["file_path"] = image_path
-                logger.info(f"保存图片: {image_path} (第{row_idx + 1}行, 列'{col_name}')")
-
-        return result
+        return process_datadreamer_image(value, image_dir, row_idx, col_name, img_counter_dict, save_queue)
 
     elif isinstance(value, (list, tuple)):
         return [
-            process_value(item, image_dir, row_idx, f"{col_name}_item{i}", img_counter_dict)
+            process_value(item, image_dir, row_idx, f"{col_name}_item{i}", img_counter_dict, save_queue)
             for i, item in enumerate(value)
         ]
     elif isinstance(value, dict):
         return {
-            k: process_value(v, image_dir, row_idx, f"{col_name}_{k}", img_counter_dict)
+            k: process_value(v, image_dir, row_idx, f"{col_name}_{k}", img_counter_dict, save_queue)
             for k, v in value.items()
         }
     elif isinstance(value, bytes):
         try:
             return value.decode('utf-8')
         except UnicodeDecodeError:
-            return base64.b64encode(value).decode('utf-8')
+            return pybase64.b64encode_as_string(value)
     else:
         return value
 
 
-def convert_dataset_to_jsonl(dataset_dir):
+def classify_columns(features):
+    """
+    根据dataset.features对列进行一次性分类，避免逐单元格做类型判断
+
+    Returns:
+        dict: 列名 -> "image"（Image特征）/ "scalar"（非二进制的Value）/ "nested"（其他）
+    """
+    column_kinds = {}
+    for col, feature in features.items():
+        if isinstance(feature, ImageFeature):
+            column_kinds[col] = "image"
+        elif isinstance(feature, Value) and feature.dtype not in ("binary", "large_binary"):
+            column_kinds[col] = "scalar"
+        else:
+            column_kinds[col] = "nested"
+    return column_kinds
+
+
+def scalar_column_to_pylist(column):
+    """
+    将标量列整列转换为Python列表
+    浮点列的NaN在Arrow中批量替换为null，行循环中标量列无需逐值判空
+    """
+    if pa.types.is_floating(column.type):
+        column = pc.if_else(pc.is_nan(column), pa.scalar(None, type=column.type), column)
+    return column.to_pylist()
+
+
+def encode_image_column(values):
+    """
+    对一个批次中整列的DataDreamer图片数据一次性做base64编码
+    非DataDreamer图片格式的位置为None，由process_value处理
+    """
+    encode = pybase64.b64encode_as_string
+    return [encode(value["bytes"]) if is_datadreamer_image_format(value) else None for value in values]
+
+
+def open_jsonl_output(output_file, compress=False):
+    """
+    以二进制模式打开JSONL输出文件，compress为True时写入gzip流
+    """
+    if compress:
+        return gzip.open(output_file, 'wb', compresslevel=GZIP_COMPRESS_LEVEL)
+    return open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+
+
+def convert_rows_to_jsonl(dataset_path, start, stop, output_file, image_dir, compress=False):
+    """
+    将数据集中[start, stop)范围内的行转换为JSONL片段，同时保存图片文件
+
+    Args:
+        dataset_path: 数据集_dataset目录
+        start: 起始行号（包含）
+        stop: 结束行号（不包含）
+        output_file: JSONL输出文件
+        image_dir: 图片保存目录
+        compress: 是否以gzip流写出（多个gzip片段直接拼接仍是合法的gzip文件）
+
+    Returns:
+        tuple: (保存的图片数量, 图片计数器字典)
+    """
+    # 直接按Arrow批次读取，不经过pandas；Image列保持{"bytes", "path"}结构，不会被解码
+    dataset = Dataset.load_from_disk(str(dataset_path))
+    dataset = dataset.select(range(start, stop)).with_format("arrow")
+    column_names = dataset.column_names
+    column_kinds = classify_columns(dataset.features)
+
+    # 图片计数器，用于跟踪每个位置的图片数量，键为(行号, 列名)
+    img_counter_dict = defaultdict(int)
+    total_images_saved = 0
+
+    # 已组装但仍在等待图片保存完成的行，数量受MAX_PENDING_ROWS限制
+    pending_rows = deque()
+    # 累积多行JSON字节后再整体写入，减少write调用次数
+    write_buffer = bytearray()
+
+    def write_row(row_idx, row_dict, pending_saves):
+        nonlocal total_images_saved
+
+        # 等待这一行的图片保存完成，回填file_path
+        ImageSaveQueue.resolve(pending_saves)
+
+        # 统计这一行保存的图片数量
+        row_image_count = sum(
+            1 for value in row_dict.values()
+            if isinstance(value, dict) and value.get("type") == "image" and "file_path" in value
+        )
+
+        # 在行数据中添加元数据
+        row_dict["_metadata"] = {
+            "row_index": row_idx,
+            "images_in_row": row_image_count
+        }
+
+        total_images_saved += row_image_count
+
+        # orjson直接输出紧凑的UTF-8字节，default=str兜底无法序列化的值
+        write_buffer.extend(orjson.dumps(row_dict, default=str))
+        write_buffer.extend(b"\n")
+        if len(write_buffer) >= WRITE_BUFFER_SIZE:
+            f.write(write_buffer)
+            write_buffer.clear()
+
+        if (row_idx + 1 - start) % 100 == 0 or (row_idx + 1) == stop:
+            logger.info(f"已处理 {row_idx + 1 - start}/{stop - start} 行 (第{start + 1}-{stop}行)，"
+                        f"累计保存 {total_images_saved} 张图片")
+
+    with ThreadPoolExecutor(max_workers=IMAGE_SAVE_WORKERS) as save_executor, \
+            open_jsonl_output(output_file, compress) as f:
+        save_queue = ImageSaveQueue(save_executor)
+        idx = start
+        for batch in dataset.iter(batch_size=ARROW_BATCH_SIZE):
+            column_values = [
+                scalar_column_to_pylist(batch.column(col)) if column_kinds[col] == "scalar"
+                else batch.column(col).to_pylist()
+                for col in column_names
+            ]
+            # 图片列在行循环之前整列完成base64编码
+            column_base64 = [
+                encode_image_column(values) if column_kinds[col] == "image" else None
+                for col, values in zip(column_names, column_values)
+            ]
+
+            for batch_pos, row_values in enumerate(zip(*column_values)):
+                row_dict = {}
+
+                for col, value, base64_values in zip(column_names, row_values, column_base64):
+                    column_kind = column_kinds[col]
+
+                    if column_kind == "scalar":
+                        row_dict[col] = value
+                    elif is_null(value):
+                        row_dict[col] = None
+                    elif base64_values is not None and base64_values[batch_pos] is not None:
+                        row_dict[col] = process_datadreamer_image(
+                            value, image_dir, idx, col, img_counter_dict, save_queue,
+                            base64_values[batch_pos]
+                        )
+                    else:
+                        row_dict[col] = process_value(
+                            value, image_dir, idx, col, img_counter_dict, save_queue
+                        )
+
+                pending_rows.append((idx, row_dict, save_queue.take_pending()))
+                if len(pending_rows) > MAX_PENDING_ROWS:
+                    write_row(*pending_rows.popleft())
+
+                idx += 1
+
+        while pending_rows:
+            write_row(*pending_rows.popleft())
+
+        f.write(write_buffer)
+
+    return total_images_saved, img_counter_dict
+
+
+def split_row_ranges(num_rows, num_shards):
+    """
+    将[0, num_rows)切分为最多num_shards个连续区间，每个区间至少MIN_ROWS_PER_SHARD行
+    """
+    num_shards = max(1, min(num_shards, num_rows // MIN_ROWS_PER_SHARD))
+    shard_size, remainder = divmod(num_rows, num_shards)
+
+    ranges = []
+    start = 0
+    for i in range(num_shards):
+        stop = start + shard_size + (1 if i < remainder else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def init_worker():
+    """
+    转换子进程初始化：loguru输出中带上进程名，便于区分各分片的日志
+    """
+    logger.remove()
+    logger.add(sys.stderr, format=WORKER_LOG_FORMAT)
+
+
+def create_worker_pool(max_workers):
+    """
+    创建行分片转换使用的进程池
+    loguru内部有线程，使用spawn避免fork带来的问题
+    """
+    mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context, initializer=init_worker)
+
+
+def convert_dataset_to_jsonl(dataset_dir, num_workers=1, compress=False, executor=None):
     """
     将单个数据集目录转换为JSONL格式，同时保存图片文件
+
+    Args:
+        dataset_dir: 数据集目录
+        num_workers: 行分片数，1表示在当前进程中串行转换
+        compress: 是否输出gzip压缩的.jsonl.gz文件
+        executor: 可选的共享进程池，不分片时整个数据集也在其中转换；未提供且需要分片时临时创建进程池
     """
     dataset_path = dataset_dir / "_dataset"
 
@@ -209,67 +441,60 @@ def convert_dataset_to_jsonl(dataset_dir):
     try:
         logger.info(f"加载数据集: {dataset_dir.name}")
         dataset = Dataset.load_from_disk(str(dataset_path))
-
-        df = dataset.to_pandas()
+        num_rows = len(dataset)
 
         # 创建输出文件和图片目录
-        output_file = dataset_path / f"{dataset_dir.name}.jsonl"
+        output_suffix = ".jsonl.gz" if compress else ".jsonl"
+        output_file = dataset_path / f"{dataset_dir.name}{output_suffix}"
         image_dir = dataset_path / "images"
+        image_dir.mkdir(parents=True, exist_ok=True)
+        # 逐图片拼接路径时直接使用字符串，避免重复构造Path对象
+        image_dir_str = str(image_dir)
 
-        # 图片计数器，用于跟踪每个位置的图片数量
-        img_counter_dict = {}
-
-        logger.info(f"开始转换 {len(df)} 行数据，{len(df.columns)} 列")
-        logger.info(f"列名: {list(df.columns)}")
+        logger.info(f"开始转换 {num_rows} 行数据，{len(dataset.column_names)} 列")
+        logger.info(f"列名: {dataset.column_names}")
         logger.info(f"图片将保存到: {image_dir}")
 
-        total_images_saved = 0
+        row_ranges = split_row_ranges(num_rows, num_workers)
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for idx, row in df.iterrows():
-                row_dict = {}
-                row_image_count = 0
-
-                for col in df.columns:
-                    value = row[col]
-
-                    try:
-                        if pd.isna(value):
-                            row_dict[col] = None
-                        else:
-                            processed_value = process_value(
-                                value, image_dir, idx, col, img_counter_dict
-                            )
-                            row_dict[col] = processed_value
-
-                            # 统计这一行保存的图片数量
-                            if (isinstance(processed_value, dict) and
-                                    processed_value.get("type") == "image" and
-                                    "file_path" in processed_value):
-                                row_image_count += 1
-
-                    except (ValueError, TypeError):
-                        if value is None:
-                            row_dict[col] = None
-                        else:
-                            processed_value = process_value(
-                                value, image_dir, idx, col, img_counter_dict
-                            )
-                            row_dict[col] = processed_value
-
-                # 在行数据中添加元数据
-                row_dict["_metadata"] = {
-                    "row_index": idx,
-                    "images_in_row": row_image_count
-                }
-
-                total_images_saved += row_image_count
-
-                json_line = json.dumps(row_dict, ensure_ascii=False, separators=(',', ':'))
-                f.write(json_line + '\n')
-
-                if (idx + 1) % 100 == 0 or (idx + 1) == len(df):
-                    logger.info(f"已处理 {idx + 1}/{len(df)} 行，累计保存 {total_images_saved} 张图片")
+        if len(row_ranges) == 1:
+            # 不分片的数据集整体交给共享进程池（若有），多个小数据集可以并行转换
+            rows_args = (dataset_path, 0, num_rows, output_file, image_dir_str, compress)
+            if executor is None:
+                total_images_saved, img_counter_dict = convert_rows_to_jsonl(*rows_args)
+            else:
+                total_images_saved, img_counter_dict = executor.submit(convert_rows_to_jsonl, *rows_args).result()
+        else:
+            # 每个分片写入独立的片段文件，图片文件名含行号，不会冲突
+            part_files = [
+                output_file.with_name(f"{output_file.name}.part{i}")
+                for i in range(len(row_ranges))
+            ]
+
+            shard_args = [
+                (dataset_path, start, stop, part_file, image_dir_str, compress)
+                for (start, stop), part_file in zip(row_ranges, part_files)
+            ]
+            if executor is None:
+                with create_worker_pool(len(row_ranges)) as own_executor:
+                    futures = [own_executor.submit(convert_rows_to_jsonl, *args) for args in shard_args]
+                    shard_results = [future.result() for future in futures]
+            else:
+                futures = [executor.submit(convert_rows_to_jsonl, *args) for args in shard_args]
+                shard_results = [future.result() for future in futures]
+
+            # 按顺序合并片段（gzip片段直接拼接即为多成员gzip文件）
+            with open(output_file, 'wb') as out:
+                for part_file in part_files:
+                    with open(part_file, 'rb') as part:
+                        shutil.copyfileobj(part, out)
+                    part_file.unlink()
+
+            total_images_saved = 0
+            img_counter_dict = defaultdict(int)
+            for shard_images, shard_counters in shard_results:
+                total_images_saved += shard_images
+                img_counter_dict.update(shard_counters)
 
         logger.success(f"转换完成!")
         logger.info(f"JSONL文件: {output_file}")
@@ -278,9 +503,8 @@ def convert_dataset_to_jsonl(dataset_dir):
         # 显示图片保存统计
         if total_images_saved > 0:
             logger.info("图片保存统计:")
-            for key, count in img_counter_dict.items():
-                row_idx, col_name = key.split('_', 1)
-                logger.info(f"  第{int(row_idx) + 1}行, 列'{col_name}': {count}张图片")
+            for (row_idx, col_name), count in img_counter_dict.items():
+                logger.info(f"  第{row_idx + 1}行, 列'{col_name}': {count}张图片")
         else:
             logger.warning("没有发现图片数据或图片数据格式不匹配")
 
@@ -293,9 +517,20 @@ def convert_dataset_to_jsonl(dataset_dir):
         return False
 
 
+def count_dataset_rows(dataset_dir):
+    """
+    读取数据集行数（load_from_disk只做内存映射，不读取数据）
+    """
+    dataset_path = dataset_dir / "_dataset"
+    if not dataset_path.exists():
+        return 0
+    return len(Dataset.load_from_disk(str(dataset_path)))
+
+
 def discover_datasets(session_output_dir):
     """
     自动发现session_output目录下的所有数据集
+    同时查找下一级目录，例如test_pipelines.py为每个管道使用的独立输出目录 session_output/<x>_test/
     """
     if not session_output_dir.exists():
         logger.error(f"session_output目录不存在: {session_output_dir}")
@@ -304,11 +539,17 @@ def discover_datasets(session_output_dir):
     datasets = []
 
     for item in session_output_dir.iterdir():
-        if item.is_dir():
-            dataset_subdir = item / "_dataset"
-            if dataset_subdir.exists():
-                datasets.append(item)
-                logger.info(f"发现数据集: {item.name}")
+        # 跳过 .cache 等隐藏目录
+        if not item.is_dir() or item.name.startswith("."):
+            continue
+        if (item / "_dataset").exists():
+            datasets.append(item)
+            logger.info(f"发现数据集: {item.name}")
+            continue
+        for sub_item in item.iterdir():
+            if sub_item.is_dir() and (sub_item / "_dataset").exists():
+                datasets.append(sub_item)
+                logger.info(f"发现数据集: {item.name}/{sub_item.name}")
 
     return datasets
 
@@ -321,6 +562,8 @@ def main():
     parser.add_argument("--dataset", type=str, help="指定要转换的数据集名称（可选）")
     parser.add_argument("--session-dir", type=str, default="session_output",
                         help="session输出目录名称（默认: session_output）")
+    parser.add_argument("--compress", action="store_true",
+                        help="输出gzip压缩的.jsonl.gz文件")
 
     args = parser.parse_args()
 
@@ -329,12 +572,13 @@ def main():
     logger.info(f"项目根目录: {project_root}")
 
     session_output_dir = project_root / args.session_dir
+    num_workers = os.cpu_count() or 1
 
     if args.dataset:
         target_dataset = session_output_dir / args.dataset
         if target_dataset.exists():
             logger.info(f"转换指定数据集: {args.dataset}")
-            convert_dataset_to_jsonl(target_dataset)
+            convert_dataset_to_jsonl(target_dataset, num_workers=num_workers, compress=args.compress)
         else:
             logger.error(f"指定的数据集不存在: {args.dataset}")
     else:
@@ -349,13 +593,34 @@ def main():
         success_count = 0
         total_images = 0
 
-        for dataset_dir in datasets:
-            if convert_dataset_to_jsonl(dataset_dir):
+        # 各数据集由线程并发调度，实际转换在共用的进程池中进行（行转换受GIL限制，线程无法并行），
+        # 子进程在数据集之间保持常驻。只有一个不需要分片的小数据集时直接在当前进程中转换
+        needs_sharding = any(
+            len(split_row_ranges(count_dataset_rows(dataset_dir), num_workers)) > 1
+            for dataset_dir in datasets
+        )
+        with ThreadPoolExecutor(max_workers=len(datasets)) as dispatcher:
+            if needs_sharding or len(datasets) > 1:
+                pool_size = num_workers if needs_sharding else min(num_workers, len(datasets))
+                with create_worker_pool(pool_size) as executor:
+                    results = list(dispatcher.map(
+                        partial(convert_dataset_to_jsonl, num_workers=num_workers, compress=args.compress,
+                                executor=executor),
+                        datasets
+                    ))
+            else:
+                results = list(dispatcher.map(
+                    partial(convert_dataset_to_jsonl, num_workers=1, compress=args.compress),
+                    datasets
+                ))
+
+        for dataset_dir, success in zip(datasets, results):
+            if success:
                 success_count += 1
                 # 统计这个数据集保存的图片数量
                 image_dir = dataset_dir / "_dataset" / "images"
                 if image_dir.exists():
-                    images_count = len(list(image_dir.glob("*.png")))
+                    images_count = sum(1 for path in image_dir.iterdir() if path.is_file())
                     total_images += images_count
 
         logger.info(f"转换完成: {success_count}/{len(datasets)} 个数据集成功")
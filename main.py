@@ -1,4 +1,7 @@
 import os
+import sys
+import json
+import traceback
 from argparse import ArgumentParser
 from dotenv import load_dotenv
 
@@ -10,6 +13,7 @@ from pipeline.utils.datadreamer_patches import *
 
 from pipeline import run_datadreamer_session
 from pipeline.utils.gpt4o_support import datadreamer_gpt4o_support
+from worker_protocol import WORKER_DONE
 
 
 def validate_config():
@@ -106,6 +110,25 @@ def main(args):
         run_datadreamer_session(args)
 
 
+def serve(parser):
+    """
+    Run pipeline requests read from stdin, one JSON list of command-line arguments per line,
+    so several runs share a single interpreter start-up and import.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            main(parser.parse_args(json.loads(line)))
+        except (Exception, SystemExit):
+            # Bad JSON, argparse errors (SystemExit) and pipeline failures end only this request
+            traceback.print_exc()
+        # Start the marker on a fresh line even if the request's output didn't end with one
+        sys.stderr.flush()
+        sys.stdout.write(f"\n{WORKER_DONE}\n")
+        sys.stdout.flush()
+
+
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument(
@@ -199,6 +222,19 @@ if __name__ == "__main__":
         default=True,
         help="whether to generate QA for the visualizations.",
     )
+    parser.add_argument(
+        "-d",
+        "--output_folder",
+        type=str,
+        default="./session_output",
+        help="The DataDreamer output folder (use a separate one for each concurrent run).",
+    )
+    parser.add_argument(
+        "--server",
+        action="store_true",
+        default=False,
+        help="Read pipeline requests (JSON lists of these arguments) from stdin, one per line.",
+    )
 
     args = parser.parse_args()
 
@@ -206,6 +242,10 @@ if __name__ == "__main__":
     if not validate_config():
         exit(1)
 
+    if args.server:
+        serve(parser)
+        exit(0)
+
     print("LLM:", args.llm)
     print("Code LLM:", args.code_llm)
     print("Pipelines:", args.pipelines)
@@ -1,4 +1,9 @@
 import os
+import importlib
+import importlib.util
+from functools import lru_cache
+
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,38 +18,70 @@ from datadreamer import DataDreamer
 from datadreamer.llms import OpenAI
 from datadreamer.steps import concat
 
-from .matplotlib_chart_pipeline import MatplotlibChartPipeline
-from .vegalite_chart_pipeline import VegaLiteChartPipeline
-from .plotly_chart_pipeline import PlotlyChartPipeline
-from .latex_chart_pipeline import LaTeXChartPipeline
-from .html_chart_pipeline import HTMLChartPipeline
-
-from .latex_table_pipeline import LaTeXTablePipeline
-from .matplotlib_table_pipeline import MatplotlibTablePipeline
-from .plotly_table_pipeline import PlotlyTablePipeline
-from .html_table_pipeline import HTMLTablePipeline
-
-from .latex_document_pipeline import LaTeXDocumentPipeline
-from .html_document_pipeline import HTMLDocumentPipeline
-from .docx_document_pipeline import DOCXDocumentPipeline
-
-from .graphviz_diagram_pipeline import GraphvizDiagramPipeline
-from .latex_diagram_pipeline import LaTeXDiagramPipeline
-from .mermaid_diagram_pipeline import MermaidDiagramPipeline
-
-from .dalle_image_pipeline import DALLEImagePipeline
-
-from .rdkit_chemical_pipeline import RdkitChemicalPipeline
-from .latex_math_pipeline import LaTeXMathPipeline
-from .lilypond_music_pipeline import LilyPondMusicPipeline
-from .schemdraw_circuit_pipeline import SchemdrawCircuitPipeline
-from .latex_circuit_pipeline import LaTeXCircuitPipeline
-
-from .svg_graphic_pipeline import SVGGraphicPipeline
-from .asymptote_graphic_pipeline import AsymptoteGraphicPipeline
-
-from .html_document_point_pipeline import HTMLDocumentPointPipeline
-from .html_screen_pipeline import HTMLScreenPipeline
+# Pipelines are imported lazily: each one pulls in its own heavy dependencies
+# (matplotlib, plotly, rdkit, ...), so only the selected ones are loaded.
+PIPELINES = {
+    "Generate Matplotlib Charts": (".matplotlib_chart_pipeline", "MatplotlibChartPipeline"),
+    "Generate Vega-Lite Charts": (".vegalite_chart_pipeline", "VegaLiteChartPipeline"),
+    "Generate Plotly Charts": (".plotly_chart_pipeline", "PlotlyChartPipeline"),
+    "Generate LaTeX Charts": (".latex_chart_pipeline", "LaTeXChartPipeline"),
+    "Generate HTML Charts": (".html_chart_pipeline", "HTMLChartPipeline"),
+    "Generate LaTeX Tables": (".latex_table_pipeline", "LaTeXTablePipeline"),
+    "Generate Matplotlib Tables": (".matplotlib_table_pipeline", "MatplotlibTablePipeline"),
+    "Generate Plotly Tables": (".plotly_table_pipeline", "PlotlyTablePipeline"),
+    "Generate HTML Tables": (".html_table_pipeline", "HTMLTablePipeline"),
+    "Generate LaTeX Documents": (".latex_document_pipeline", "LaTeXDocumentPipeline"),
+    "Generate HTML Documents": (".html_document_pipeline", "HTMLDocumentPipeline"),
+    "Generate DOCX Documents": (".docx_document_pipeline", "DOCXDocumentPipeline"),
+    "Generate Graphviz Diagrams": (".graphviz_diagram_pipeline", "GraphvizDiagramPipeline"),
+    "Generate LaTeX Diagrams": (".latex_diagram_pipeline", "LaTeXDiagramPipeline"),
+    "Generate Mermaid Diagrams": (".mermaid_diagram_pipeline", "MermaidDiagramPipeline"),
+    "Generate DALL-E Images": (".dalle_image_pipeline", "DALLEImagePipeline"),
+    "Generate Chemical Structures": (".rdkit_chemical_pipeline", "RdkitChemicalPipeline"),
+    "Generate LaTeX Math": (".latex_math_pipeline", "LaTeXMathPipeline"),
+    "Generate Lilypond Music": (".lilypond_music_pipeline", "LilyPondMusicPipeline"),
+    "Generate SchemDraw Circuits": (".schemdraw_circuit_pipeline", "SchemdrawCircuitPipeline"),
+    "Generate LaTeX Circuits": (".latex_circuit_pipeline", "LaTeXCircuitPipeline"),
+    "Generate SVG Graphics": (".svg_graphic_pipeline", "SVGGraphicPipeline"),
+    "Generate Asymptote Graphics": (".asymptote_graphic_pipeline", "AsymptoteGraphicPipeline"),
+    "Generate HTML Points": (".html_document_point_pipeline", "HTMLDocumentPointPipeline"),
+    "Generate HTML Screens": (".html_screen_pipeline", "HTMLScreenPipeline"),
+}
+
+
+def load_pipeline(module_name, class_name):
+    return getattr(importlib.import_module(module_name, package=__package__), class_name)
+
+
+# Environment configuration, read once at import (after load_dotenv above)
+API_MODE = os.getenv("API_MODE", "official")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_MINI_MODEL = os.getenv("OPENAI_MINI_MODEL", "gpt-4o-mini")
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-7-sonnet-20250219")
+# LLM responses are cached by DataDreamer keyed on (model, prompt, generation args).
+# Pointing LLM_CACHE_DIR outside the session folder lets re-runs reuse them.
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+# Azure mode: send large prompt sets through the Azure Batch API
+AZURE_USE_BATCH_API = os.getenv("AZURE_USE_BATCH_API", "0") == "1"
+# Azure mode: answer up to this many short prompts per request (1 disables packing)
+AZURE_PACK_SIZE = int(os.getenv("AZURE_PACK_SIZE", "1"))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@lru_cache(maxsize=None)
+def get_shared_http_client():
+    """
+    所有 OpenAI SDK 客户端共用的 HTTP 连接池（复用 keep-alive 连接，减少 TLS 握手）
+    安装了 h2 时启用 HTTP/2，并发请求可在同一连接上多路复用
+    """
+    return httpx.Client(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    )
 
 
 def create_llm_instance(model_name, api_key=None, system_prompt="You are a helpful data scientist.", api_mode=None):
@@ -52,43 +89,61 @@ def create_llm_instance(model_name, api_key=None, system_prompt="You are a helpf
     根据 API 模式创建相应的 LLM 实例
     """
     if api_mode is None:
-        api_mode = os.getenv("API_MODE", "official")
+        api_mode = API_MODE
+
+    cache_folder_path = LLM_CACHE_DIR
+    llm = None
 
     if api_mode == "official":
         # Official API mode - use direct API access
         if "gpt" in model_name.lower():
-            return OpenAI(
+            llm = OpenAI(
                 model_name=model_name,
                 api_key=api_key,
                 system_prompt=system_prompt,
-                base_url=os.getenv("OPENAI_BASE_URL")
+                base_url=OPENAI_BASE_URL,
+                cache_folder_path=cache_folder_path,
+                http_client=get_shared_http_client()
             )
         elif "claude" in model_name.lower():
-            return CustomAnthropic(
+            llm = CustomAnthropic(
                 model_name=model_name,
                 api_key=api_key,
-                base_url=os.getenv("ANTHROPIC_BASE_URL")
+                base_url=ANTHROPIC_BASE_URL,
+                cache_folder_path=cache_folder_path
             )
 
     elif api_mode == "proxy":
         # Proxy mode - use unified proxy API for all models
         from pipeline.utils.proxy_llm_fixed import ProxyLLM
-        return ProxyLLM(
+        llm = ProxyLLM(
             model_name=model_name,
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            cache_folder_path=cache_folder_path,
+            http_client=get_shared_http_client()
         )
 
     elif api_mode == "azure":
         # Azure mode - use Azure OpenAI for all models
         from pipeline.utils.azure_llm import AzureLLM
-        return AzureLLM(
+        llm = AzureLLM(
             model_name=model_name,
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            cache_folder_path=cache_folder_path,
+            http_client=get_shared_http_client(),
+            use_batch_api=AZURE_USE_BATCH_API,
+            pack_size=AZURE_PACK_SIZE,
         )
 
     else:
         raise ValueError(f"Unsupported API mode: {api_mode}")
 
+    if llm is not None:
+        # Build the API client now: a constructor kwarg the client doesn't accept fails
+        # here at start-up instead of on the first request of a pipeline
+        llm.client
+    return llm
+
 
 def run_datadreamer_session(args):
     if args.qa:
@@ -96,12 +151,12 @@ def run_datadreamer_session(args):
     else:
         os.environ["GENERATE_QA"] = "false"
 
-    with DataDreamer("./session_output"):
+    with DataDreamer(args.output_folder):
         # Get API mode and model configurations from environment
-        api_mode = os.getenv("API_MODE", "official")
-        openai_model = os.getenv("OPENAI_MODEL", "gpt-4o")
-        openai_mini_model = os.getenv("OPENAI_MINI_MODEL", "gpt-4o-mini")
-        anthropic_model = os.getenv("ANTHROPIC_MODEL", "claude-3-7-sonnet-20250219")
+        api_mode = API_MODE
+        openai_model = OPENAI_MODEL
+        openai_mini_model = OPENAI_MINI_MODEL
+        anthropic_model = ANTHROPIC_MODEL
 
         print(f"API Mode: {api_mode}")
         print(f"Models - OpenAI: {openai_model}, OpenAI Mini: {openai_mini_model}, Anthropic: {anthropic_model}")
@@ -178,37 +233,11 @@ def run_datadreamer_session(args):
         print(f"Selected Code LLM: {args.code_llm} -> {type(code_llm).__name__}")
 
         # Choose which pipelines to run
+        selected = [p.strip() for p in args.pipelines.split(",")]
         pipelines = {
-            "Generate Matplotlib Charts": MatplotlibChartPipeline,
-            "Generate Vega-Lite Charts": VegaLiteChartPipeline,
-            "Generate Plotly Charts": PlotlyChartPipeline,
-            "Generate LaTeX Charts": LaTeXChartPipeline,
-            "Generate HTML Charts": HTMLChartPipeline,
-            "Generate LaTeX Tables": LaTeXTablePipeline,
-            "Generate Matplotlib Tables": MatplotlibTablePipeline,
-            "Generate Plotly Tables": PlotlyTablePipeline,
-            "Generate HTML Tables": HTMLTablePipeline,
-            "Generate LaTeX Documents": LaTeXDocumentPipeline,
-            "Generate HTML Documents": HTMLDocumentPipeline,
-            "Generate DOCX Documents": DOCXDocumentPipeline,
-            "Generate Graphviz Diagrams": GraphvizDiagramPipeline,
-            "Generate LaTeX Diagrams": LaTeXDiagramPipeline,
-            "Generate Mermaid Diagrams": MermaidDiagramPipeline,
-            "Generate DALL-E Images": DALLEImagePipeline,
-            "Generate Chemical Structures": RdkitChemicalPipeline,
-            "Generate LaTeX Math": LaTeXMathPipeline,
-            "Generate Lilypond Music": LilyPondMusicPipeline,
-            "Generate SchemDraw Circuits": SchemdrawCircuitPipeline,
-            "Generate LaTeX Circuits": LaTeXCircuitPipeline,
-            "Generate SVG Graphics": SVGGraphicPipeline,
-            "Generate Asymptote Graphics": AsymptoteGraphicPipeline,
-            "Generate HTML Points": HTMLDocumentPointPipeline,
-            "Generate HTML Screens": HTMLScreenPipeline,
-        }
-        pipelines = {
-            k: v
-            for k, v in pipelines.items()
-            if v.__name__ in [p.strip() for p in args.pipelines.split(",")]
+            k: load_pipeline(module_name, class_name)
+            for k, (module_name, class_name) in PIPELINES.items()
+            if class_name in selected
         }
 
         # Choose how many visualizes per pipeline
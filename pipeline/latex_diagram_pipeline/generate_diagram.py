@@ -1,25 +1,74 @@
 import os
+import shutil
 import tempfile
 import platform
 import subprocess
-import json
+import orjson
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
+from datasets import Dataset, Features, Image as ImageFeature, Value
 from datasets.fingerprint import Hasher
-from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
+from datadreamer.steps import DataSource, SuperStep, Prompt
 
-from ..prompts.diagram_prompts import GENERATE_DIAGRAM_CODE_LATEX_PROMPT
-from ..utils.utils import extract_latex, process_image
+from ..prompts.diagram_prompts import (
+    GENERATE_DIAGRAM_CODE_LATEX_BATCH_PROMPT,
+    GENERATE_DIAGRAM_CODE_LATEX_BATCH_INPUT,
+)
+from ..utils.utils import extract_latex_blocks, output_to_rows, encode_png, process_image
 from ..utils.render import render_latex
 
 NUM_RENDER_WORKERS = 4
 
+# Rendering runs on worker threads, where warnings.catch_warnings() isn't thread-safe;
+# silence the image libraries' warnings once at import instead
+warnings.filterwarnings("ignore", module=r"(PIL|pdf2image)(\.|$)")
+
+# Output schema of the render step; images are stored as pre-encoded PNG bytes
+IMAGE_ROW_FEATURES = Features(
+    {
+        "metadata": Value("string"),
+        "topic": Value("string"),
+        "data": Value("string"),
+        "code": Value("string"),
+        "image": ImageFeature(),
+    }
+)
+# Number of rows marshaled into a single code-generation prompt (capped at 4)
+BATCH_ROWS = 4
+# Prompt batches generated per chunk before that chunk is handed to the render pool
+GENERATION_CHUNK_BATCHES = 4
+
+
+# A successful pdflatex check is remembered for the process and, across sessions,
+# in a sentinel file keyed by the pdflatex binary's path and mtime.
+PDFLATEX_SENTINEL = os.path.join(os.path.expanduser("~"), ".cache", "pixmo", "pdflatex_ok")
+_PDFLATEX_CHECKED = False
+_TOOLS_CHECKED = False
+
+
+def _pdflatex_key():
+    pdflatex_path = shutil.which("pdflatex")
+    if pdflatex_path is None:
+        return None
+    return f"{pdflatex_path}:{os.path.getmtime(pdflatex_path)}"
+
 
 def check_pdflatex():
+    global _PDFLATEX_CHECKED
+    if _PDFLATEX_CHECKED:
+        return
+
+    key = _pdflatex_key()
+    if key is not None and os.path.exists(PDFLATEX_SENTINEL):
+        with open(PDFLATEX_SENTINEL) as f:
+            if f.read() == key:
+                _PDFLATEX_CHECKED = True
+                return
+
     # Create a simple LaTeX document without PyLaTeX to avoid package dependencies
     latex_content = r"""\documentclass{article}
 \begin{document}
@@ -47,6 +96,15 @@ This is a test document to check if pdflatex is available.
         if result.returncode != 0:
             raise RuntimeError(f"pdflatex compilation failed: {result.stderr}")
 
+        _PDFLATEX_CHECKED = True
+        if key is not None:
+            try:
+                os.makedirs(os.path.dirname(PDFLATEX_SENTINEL), exist_ok=True)
+                with open(PDFLATEX_SENTINEL, "w") as f:
+                    f.write(key)
+            except OSError:
+                pass
+
     except FileNotFoundError:
         raise RuntimeError(
             "Your system must have pdflatex installed to run this pipeline. "
@@ -58,17 +116,21 @@ This is a test document to check if pdflatex is available.
         )
     finally:
         # Clean up
-        import shutil
         shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 def check_tools():
+    global _TOOLS_CHECKED
+    if _TOOLS_CHECKED:
+        return
+    _TOOLS_CHECKED = True
+
     system = platform.system()
     required_tools = ["pdftoppm", "pdftocairo"]
     missing_tools = [
         tool
         for tool in required_tools
-        if subprocess.run(["which", tool], capture_output=True).returncode != 0
+        if shutil.which(tool) is None
     ]
 
     if missing_tools:
@@ -81,16 +143,32 @@ def check_tools():
         print("Continuing without these tools...")
 
 
-class TimeoutException(Exception):
-    pass
+def execute_code_and_generate_image(row, timeout=20):
+    try:
+        image = render_latex(row["code"], timeout=timeout)
+
+        if not isinstance(image, Image.Image):
+            raise TypeError()
 
+        row["image"] = encode_png(process_image(image))
+    except subprocess.TimeoutExpired:
+        print(f"Error: Code execution exceeded {timeout} seconds.")
+        row["image"] = None
+    except Exception as e:
+        print(f"Error: {e}")
+        row["image"] = None
 
-def timeout_handler(signum, frame):
-    raise TimeoutException()
+    return row
 
 
 class GenerateDiagram(SuperStep):
-    CONFIG_HASH = Hasher.hash([GENERATE_DIAGRAM_CODE_LATEX_PROMPT])
+    CONFIG_HASH = Hasher.hash(
+        [
+            GENERATE_DIAGRAM_CODE_LATEX_BATCH_PROMPT,
+            GENERATE_DIAGRAM_CODE_LATEX_BATCH_INPUT,
+            BATCH_ROWS,
+        ]
+    )
 
     def setup(self):
         self.register_input(
@@ -118,79 +196,87 @@ class GenerateDiagram(SuperStep):
             },
         )
 
-        # Create prompts
-        prompts_dataset = combined_inputs.map(
-            lambda row: {
-                "prompt": GENERATE_DIAGRAM_CODE_LATEX_PROMPT.format(
-                    topic=row["topic"],
-                    figure_type=json.loads(row["metadata"])["figure_type"],
-                    data=row["data"],
-                    persona=json.loads(row["metadata"])["persona"],
-                )
-            },
-            lazy=False,
-            name="Create Generate Code Prompts",
-        )
+        # Create prompts, marshaling BATCH_ROWS rows into each prompt
+        input_rows = output_to_rows(combined_inputs.output)
+        row_batches = [
+            input_rows[i : i + BATCH_ROWS]
+            for i in range(0, len(input_rows), BATCH_ROWS)
+        ]
 
-        # Generate Code
-        generated_code = Prompt(
-            name="Generate",
-            inputs={
-                "prompts": prompts_dataset.output["prompt"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-                "post_process": extract_latex,
-                "temperature": 1.0,
-                "top_p": 1.0,
-            },
-            outputs={
-                "generations": "code",
-            },
-        ).select_columns(["code"], name="Get Generated Code")
+        def create_prompt(rows):
+            inputs = []
+            for index, row in enumerate(rows, start=1):
+                meta = orjson.loads(row["metadata"])
+                inputs.append(
+                    GENERATE_DIAGRAM_CODE_LATEX_BATCH_INPUT.format(
+                        index=index,
+                        persona=meta["persona"],
+                        topic=row["topic"],
+                        figure_type=meta["figure_type"],
+                        data=row["data"],
+                    )
+                )
+            return GENERATE_DIAGRAM_CODE_LATEX_BATCH_PROMPT.format(
+                num_inputs=len(rows), inputs="\n\n".join(inputs)
+            )
 
-        # Combine with generations with inputs
-        combined = zipped(
-            combined_inputs, generated_code, name="Combine with inputs"
-        ).save(name="Save combine with inputs")
+        prompts = [create_prompt(rows) for rows in row_batches]
 
         # Check if pdflatex and pdf2image is available
         check_pdflatex()
         check_tools()
 
-        # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    image = render_latex(row["code"])
-
-                    if not isinstance(image, Image.Image):
-                        raise TypeError()
-                    
-                    row["image"] = process_image(image)
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
-            except Exception as e:
-                print(f"Error: {e}")
-                row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
-            
-            return row
-
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            name="Generate Images",
+        # Generate code one chunk of prompts at a time and hand each chunk's rows to the
+        # render pool right away, so rendering overlaps with generating the next chunk
+        chunk_size = self.args["batch_size"] * GENERATION_CHUNK_BATCHES
+        render_futures = []
+        with ThreadPoolExecutor(max_workers=NUM_RENDER_WORKERS) as executor:
+            for chunk_idx, start in enumerate(range(0, len(prompts), chunk_size)):
+                prompts_dataset = DataSource(
+                    f"Create Generate Code Prompts (chunk {chunk_idx})",
+                    {"prompt": prompts[start : start + chunk_size]},
+                )
+
+                # Generate Code
+                generated_code = Prompt(
+                    name=f"Generate (chunk {chunk_idx})",
+                    inputs={
+                        "prompts": prompts_dataset.output["prompt"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                        "temperature": 1.0,
+                        "top_p": 1.0,
+                    },
+                    outputs={
+                        "generations": "code",
+                    },
+                )
+
+                # Split each response back into one code block per input row
+                chunk_batches = row_batches[start : start + chunk_size]
+                for rows, response in zip(chunk_batches, generated_code.output["code"]):
+                    blocks = extract_latex_blocks(response)
+                    if len(blocks) != len(rows):
+                        # Blocks can't be matched to rows reliably; drop the whole batch
+                        print(f"Expected {len(rows)} code blocks, found {len(blocks)}")
+                        blocks = [None] * len(rows)
+                    for row, code in zip(rows, blocks):
+                        render_futures.append(
+                            executor.submit(execute_code_and_generate_image, dict(row, code=code))
+                        )
+
+            # Generate Images
+            rendered_rows = [future.result() for future in render_futures]
+
+        column_names = ["metadata", "topic", "data", "code", "image"]
+        code_and_images = DataSource(
+            "Generate Images",
+            Dataset.from_dict(
+                {column: [row[column] for row in rendered_rows] for column in column_names},
+                features=IMAGE_ROW_FEATURES,
+            ),
         )
 
         # Remove any invalid images
@@ -209,4 +295,5 @@ class GenerateDiagram(SuperStep):
 
     @property
     def version(self):
-        return hash(GenerateDiagram.CONFIG_HASH)
+        # CONFIG_HASH is a deterministic hex digest; hash() of a str is salted per process
+        return GenerateDiagram.CONFIG_HASH
@@ -164,6 +164,35 @@ Here are the requirements:
 Please don't answer with any additional text in the script. Your whole response should be the LaTeX code, which can be directly executed."""
 
 
+GENERATE_DIAGRAM_CODE_LATEX_BATCH_PROMPT = """You are an expert in data analysis and good at writing LaTeX code to generate diagrams and graphs.
+Below are {num_inputs} independent inputs. Each input gives a persona, a topic, a figure type and some data (JSON format).
+
+{inputs}
+
+For each input, please write a LaTeX script to generate the requested figure type using the data provided. Here are the requirements:
+1. **Style Requirements**:
+    (1) Try to be creative and change the default arguments (e.g., font, color, marker, etc) to make the graph style unique. You can use common LaTeX packages such as ones that help with tables (booktabs, etc.), figures (pgfplots, etc.), and drawings (tikz, etc.).
+    (2) Consider the **scale of data** to select the appropriate design scale (diagram size, node/edge size, etc) to ensure the information in the diagram is clear and easy to understand, with no text overlapping, etc.
+
+2. **Code Requirements**: You can use any LaTeX package to generate the diagram.
+    (1) You need to hardcode the provided data into the LaTeX script to generate the diagram. Be careful with the syntax and formatting of the LaTeX script.
+    (2) Use `standalone` LaTeX document class to generate the table and add some border margin (`[border=xxpt]`). **Do not add the page number.**
+    (3) Carefully organize the layout to ensure no overlapping text or elements in the diagram.
+
+3. **Output Requirements**:
+    Emit exactly {num_inputs} scripts, one per input and in the same order as the inputs. Put ```latex at the beginning and ``` at the end of each script to separate the code from the text.
+
+Please don't answer with any additional text. Your whole response should be the {num_inputs} LaTeX code blocks, each of which can be directly executed."""
+
+GENERATE_DIAGRAM_CODE_LATEX_BATCH_INPUT = """Input {index}:
+My persona is: "{persona}"
+Topic: {topic}
+Figure type: {figure_type}
+<data>
+{data}
+</data>"""
+
+
 
 
 GENERATE_DIAGRAM_CODE_MERMAID_PROMPT = """你是数据分析专家，擅长编写Mermaid代码来生成图表和图形。
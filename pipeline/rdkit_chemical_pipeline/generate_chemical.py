@@ -1,4 +1,5 @@
 import os
+import shutil
 import tempfile
 import platform
 import subprocess
@@ -8,17 +9,49 @@ import warnings
 import pandas as pd
 from io import StringIO
 import signal
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
 
 from PIL import Image
+from datasets import Dataset, Features, Image as ImageFeature, Value
 from datasets.fingerprint import Hasher
 from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.misc_prompts import GENERATE_CHEMICAL_CODE_RDKIT_PROMPT
-from ..utils.utils import extract_code, process_image
+from ..utils.utils import extract_code, output_to_rows, encode_png, process_image
 from ..utils.render import render_chemical
 
 NUM_RENDER_WORKERS = 5
 
+# Output schema of the render step; images are stored as pre-encoded PNG bytes
+IMAGE_ROW_FEATURES = Features(
+    {
+        "metadata": Value("string"),
+        "topic": Value("string"),
+        "data": Value("string"),
+        "code": Value("string"),
+        "image": ImageFeature(),
+    }
+)
+
+# Scratch directory reused by every row a render worker handles
+WORKER_TMP_DIR = None
+
+
+def init_render_worker():
+    global WORKER_TMP_DIR
+    WORKER_TMP_DIR = tempfile.mkdtemp(prefix="pixmo_render_")
+    # pool workers exit through os._exit, so use a multiprocessing finalizer rather than atexit
+    Finalize(None, shutil.rmtree, args=(WORKER_TMP_DIR,), kwargs={"ignore_errors": True}, exitpriority=0)
+
+
+def clear_worker_tmp_dir():
+    for entry in os.scandir(WORKER_TMP_DIR):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.unlink(entry.path)
+
 
 class TimeoutException(Exception):
     pass
@@ -28,6 +61,37 @@ def timeout_handler(signum, frame):
     raise TimeoutException()
 
 
+def execute_code_and_generate_image(row, timeout=20):
+    if WORKER_TMP_DIR is None:
+        init_render_worker()
+    clear_worker_tmp_dir()
+    original_dir = os.getcwd()
+    os.chdir(WORKER_TMP_DIR)
+    signal.signal(signal.SIGALRM, timeout_handler)
+    signal.alarm(timeout)  # set the timeout
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            image = render_chemical(row["code"])
+
+            if not isinstance(image, Image.Image):
+                raise TypeError()
+
+            row["image"] = encode_png(process_image(image, major_px_threshold=0.99))
+    except TimeoutException:
+        print(f"Error: Code execution exceeded {timeout} seconds.")
+        row["image"] = None
+    except Exception as e:
+        print(f"Error: {e}")
+        row["image"] = None
+    finally:
+        signal.alarm(0)  # disable the alarm
+        os.chdir(original_dir)
+
+    return row
+
+
 class GenerateChemical(SuperStep):
     CONFIG_HASH = Hasher.hash([GENERATE_CHEMICAL_CODE_RDKIT_PROMPT])
 
@@ -59,37 +123,22 @@ class GenerateChemical(SuperStep):
         )
 
         # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    image = render_chemical(row["code"])
-
-                    if not isinstance(image, Image.Image):
-                        raise TypeError()
-                    
-                    row["image"] = process_image(image, major_px_threshold=0.99)
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
-            except Exception as e:
-                print(f"Error: {e}")
-                row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
-            
-            return row
-
-        code_and_images = combined_inputs.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            name="Generate Images",
+        rows = output_to_rows(combined_inputs.output)
+
+        # Every row is rendered, even when SMILES strings repeat: render_chemical picks a
+        # random drawing style, so duplicates still produce visually different images
+        with ProcessPoolExecutor(
+            max_workers=NUM_RENDER_WORKERS, initializer=init_render_worker
+        ) as executor:
+            rendered_rows = list(executor.map(execute_code_and_generate_image, rows, chunksize=4))
+
+        column_names = combined_inputs.output.column_names + ["image"]
+        code_and_images = DataSource(
+            "Generate Images",
+            Dataset.from_dict(
+                {column: [row[column] for row in rendered_rows] for column in column_names},
+                features=IMAGE_ROW_FEATURES,
+            ),
         )
 
         # Remove any invalid images
@@ -108,4 +157,5 @@ class GenerateChemical(SuperStep):
 
     @property
     def version(self):
-        return hash(GenerateChemical.CONFIG_HASH)
+        # CONFIG_HASH is a deterministic hex digest; hash() of a str is salted per process
+        return GenerateChemical.CONFIG_HASH
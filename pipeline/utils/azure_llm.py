@@ -4,15 +4,28 @@ Azure OpenAI LLM support for DataDreamer with Azure AD authentication
 """
 
 import os
+import io
+import re
+import orjson
+import hashlib
 import time
 import threading
+from functools import cached_property, lru_cache
 from datetime import datetime, timedelta
 from datadreamer.llms import OpenAI
 from dotenv import load_dotenv
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import openai
 
+# 可选依赖：安装了 azure-identity 时由 MSAL 负责令牌缓存与刷新
+try:
+    from azure.identity import ClientSecretCredential
+except ImportError:
+    ClientSecretCredential = None
+
 # Load environment variables
 load_dotenv()
 
@@ -23,10 +36,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 两次把令牌写入客户端之间的最短间隔（秒）；令牌有效期约55分钟
+TOKEN_APPLY_INTERVAL = 60
+
+# 使用 Batch API 的最少 prompt 数量（少量 prompt 走实时接口更快）
+BATCH_API_MIN_PROMPTS = 1000
+# Batch API 需要较新的 API 版本
+BATCH_API_VERSION = os.getenv("AZURE_OPENAI_BATCH_API_VERSION", "2024-10-21")
+
+# 打包请求：每个请求最多合并的 prompt 数，以及可参与合并的单个 prompt 最大 token 数
+PACK_MAX_SIZE = 8
+PACK_MAX_PROMPT_TOKENS = 500
+PACK_INSTRUCTION = "Answer each of the following independently, prefixing each answer with [N]:"
+PACK_ANSWER_PATTERN = re.compile(r"^\[(\d+)\]\s*", re.MULTILINE)
+
+# Azure OpenAI 令牌的作用域
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
 
 class AzureTokenManager:
     """管理 Azure AD 访问令牌的自动刷新"""
 
+    # 进程内共享的令牌管理器，按 (tenant, client, secret 哈希) 区分
+    _instances = {}
+    _instances_lock = threading.RLock()
+
+    @classmethod
+    def get_or_create(cls, tenant_id, client_id, client_secret):
+        """获取共享的令牌管理器；相同凭据的多个 AzureLLM 只请求一次令牌"""
+        key = (tenant_id, client_id, hashlib.sha256(client_secret.encode("utf-8")).hexdigest())
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls(tenant_id, client_id, client_secret)
+                cls._instances[key] = manager
+            return manager
+
     def __init__(self, tenant_id, client_id, client_secret):
         self.tenant_id = tenant_id
         self.client_id = client_id
@@ -34,10 +79,44 @@ class AzureTokenManager:
         self.token = None
         self.token_expires_at = None
         self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+        if ClientSecretCredential is not None:
+            # MSAL 的内存缓存自带过期判断、提前刷新和线程安全，不需要后台线程
+            self._credential = ClientSecretCredential(tenant_id, client_id, client_secret)
+            self._credential.get_token(TOKEN_SCOPE)
+            return
+        self._credential = None
+
+        # 复用同一个连接（及 TLS 会话）请求令牌
+        self._session = requests.Session()
+        self._session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=Retry(total=3, backoff_factor=0.5)),
+        )
 
         # 获取初始令牌
         self._refresh_token()
 
+        # 后台线程在令牌到期前主动刷新，get_token 不再阻塞等待刷新
+        self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        """在 token_expires_at（已提前5分钟）时刷新令牌；失败则30秒后重试"""
+        while not self._stop.is_set():
+            sleep_for = max((self.token_expires_at - datetime.now()).total_seconds(), 0)
+            if self._stop.wait(sleep_for):
+                break
+            try:
+                self._refresh_token()
+            except Exception:
+                self._stop.wait(30)
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop.set()
+
     def _refresh_token(self):
         """从 Azure AD 获取新的访问令牌"""
         url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
@@ -45,20 +124,21 @@ class AzureTokenManager:
         data = {
             "client_id": self.client_id,
             "client_secret": self.client_secret,
-            "scope": "https://cognitiveservices.azure.com/.default",
+            "scope": TOKEN_SCOPE,
             "grant_type": "client_credentials"
         }
 
         try:
-            response = requests.post(url, data=data)
+            response = self._session.post(url, data=data, timeout=10)
             response.raise_for_status()
 
             token_data = response.json()
-            self.token = token_data["access_token"]
             expires_in = token_data.get("expires_in", 3600)  # 默认1小时
 
             # 提前5分钟刷新令牌
-            self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
+            with self.lock:
+                self.token = token_data["access_token"]
+                self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
 
             logger.info(f"Azure AD token refreshed, expires at: {self.token_expires_at}")
 
@@ -67,11 +147,32 @@ class AzureTokenManager:
             raise
 
     def get_token(self):
-        """获取有效的访问令牌，如果需要则自动刷新"""
-        with self.lock:
-            if self.token is None or datetime.now() >= self.token_expires_at:
-                self._refresh_token()
-            return self.token
+        """获取有效的访问令牌；正常情况下由后台线程刷新，这里只是读取"""
+        if self._credential is not None:
+            return self._credential.get_token(TOKEN_SCOPE).token
+        token = self.token
+        if token is None or datetime.now() >= self.token_expires_at:
+            # 后台刷新失败或尚未完成时的兜底：同步刷新
+            self._refresh_token()
+            token = self.token
+        return token
+
+
+def _marshal(prompts):
+    """把多个 prompt 合并成一条带编号的请求"""
+    numbered = "\n".join(f"[{i}] {prompt}" for i, prompt in enumerate(prompts, start=1))
+    return f"{PACK_INSTRUCTION}\n{numbered}"
+
+
+def _unmarshal(response, num_prompts):
+    """按 [N] 前缀拆分合并请求的回复；编号不完整时返回 None"""
+    parts = PACK_ANSWER_PATTERN.split(response)
+    # split 结果为 [前缀, 编号1, 回答1, 编号2, 回答2, ...]
+    # 编号必须恰好按 1..N 依次出现，重复或乱序都说明拆分不可靠
+    numbers = [int(number) for number in parts[1::2]]
+    if numbers != list(range(1, num_prompts + 1)):
+        return None
+    return [answer.strip() for answer in parts[2::2]]
 
 
 class AzureLLM(OpenAI):
@@ -80,8 +181,14 @@ class AzureLLM(OpenAI):
     完全支持 GPT-4.1 等新模型
     """
 
-    def __init__(self, model_name, system_prompt=None, **kwargs):
-        """初始化 Azure OpenAI LLM"""
+    def __init__(self, model_name, system_prompt=None, use_batch_api=False, pack_size=1, **kwargs):
+        """
+        初始化 Azure OpenAI LLM
+        use_batch_api 为 True 时大量 prompt 默认走 Batch API；pack_size > 1 时默认合并短 prompt
+        """
+
+        self.use_batch_api = use_batch_api
+        self.pack_size = pack_size
 
         # 获取 Azure 配置
         self.tenant_id = os.getenv("AZURE_OPENAI_TENANT_ID")
@@ -96,7 +203,8 @@ class AzureLLM(OpenAI):
             raise ValueError("Missing required Azure OpenAI configuration. Check your environment variables.")
 
         # 初始化令牌管理器
-        self.token_manager = AzureTokenManager(self.tenant_id, self.client_id, self.client_secret)
+        self.token_manager = AzureTokenManager.get_or_create(self.tenant_id, self.client_id, self.client_secret)
+        self._last_token_apply = 0.0
 
         # 模型名称到部署名称的映射
         self.deployment_mapping = self._get_deployment_mapping()
@@ -140,8 +248,10 @@ class AzureLLM(OpenAI):
         # 统一返回 gpt-4-preview，DataDreamer 会将其识别为 chat 模型
         return "gpt-4-preview"
 
-    def _get_deployment_mapping(self):
-        """获取模型名称到 Azure 部署名称的映射"""
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _get_deployment_mapping():
+        """获取模型名称到 Azure 部署名称的映射（进程内只读取一次环境变量）"""
         return {
             # 常用模型的显式映射（如果部署名称与模型名称不同）
             "gpt-4o": os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o"),
@@ -172,8 +282,13 @@ class AzureLLM(OpenAI):
 
         return deployment_name
 
-    def _refresh_client_token(self):
-        """刷新客户端的访问令牌"""
+    def _refresh_client_token(self, force=False):
+        """刷新客户端的访问令牌（除非 force，否则 TOKEN_APPLY_INTERVAL 秒内只执行一次）"""
+        now = time.monotonic()
+        if not force and now - self._last_token_apply < TOKEN_APPLY_INTERVAL:
+            return
+        self._last_token_apply = now
+
         new_token = self.token_manager.get_token()
 
         # 更新 OpenAI 客户端的 API key
@@ -184,75 +299,234 @@ class AzureLLM(OpenAI):
         if hasattr(self.client, 'default_headers'):
             self.client.default_headers["Authorization"] = f"Bearer {new_token}"
 
+    @cached_property
+    def batch_client(self):
+        """Batch API 客户端（Files/Batches 接口位于资源根路径下，而不是部署路径下）"""
+        return openai.AzureOpenAI(
+            azure_endpoint=self.endpoint,
+            azure_ad_token_provider=self.token_manager.get_token,
+            api_version=BATCH_API_VERSION,
+        )
+
+    def _build_messages(self, prompt):
+        """单个 prompt 对应的 chat 消息（带上系统提示）"""
+        messages = []
+        if self.system_prompt is not None:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def submit_batch(self, prompts, max_new_tokens=None, temperature=1.0, top_p=0.0):
+        """将 prompts 写成 JSONL 上传，并提交一个 Batch 任务，返回 batch id"""
+        buffer = io.BytesIO()
+        for i, prompt in enumerate(prompts):
+            body = {
+                "model": self.deployment_name,
+                "messages": self._build_messages(prompt),
+                "temperature": temperature,
+                "top_p": top_p,
+            }
+            if max_new_tokens is not None:
+                body["max_tokens"] = max_new_tokens
+            request = {"custom_id": str(i), "method": "POST", "url": "/chat/completions", "body": body}
+            buffer.write(orjson.dumps(request, option=orjson.OPT_APPEND_NEWLINE))
+
+        input_file = self.batch_client.files.create(
+            file=("batch_input.jsonl", buffer.getvalue()), purpose="batch"
+        )
+        batch = self.batch_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/chat/completions",
+            completion_window="24h",
+        )
+        logger.info(f"Submitted Azure batch {batch.id} with {len(prompts)} prompts")
+        return batch.id
+
+    def wait_for_batch(self, batch_id, poll_interval=30):
+        """轮询 Batch 任务直到结束，返回最终的 batch 对象"""
+        while True:
+            batch = self.batch_client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                return batch
+            if batch.status in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"Azure batch {batch_id} ended with status '{batch.status}'")
+            logger.info(f"Azure batch {batch_id} status: {batch.status}")
+            time.sleep(poll_interval)
+
+    def run_batch(self, prompts, max_new_tokens=None, temperature=1.0, top_p=0.0, poll_interval=30):
+        """通过 Batch API 生成，返回值与 run() 相同（每个 prompt 一个字符串，失败的为 None）"""
+        batch_id = self.submit_batch(
+            prompts, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p
+        )
+        batch = self.wait_for_batch(batch_id, poll_interval=poll_interval)
+
+        results = [None] * len(prompts)
+        if batch.output_file_id is not None:
+            output = self.batch_client.files.content(batch.output_file_id).content
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                record = orjson.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                choices = response["body"]["choices"]
+                # 内容被过滤等情况下 content 为 None，只记为该请求失败
+                content = choices[0]["message"].get("content")
+                if content is not None:
+                    results[int(record["custom_id"])] = content.strip()
+
+        num_failed = sum(result is None for result in results)
+        if num_failed:
+            logger.warning(f"Azure batch {batch_id}: {num_failed} of {len(prompts)} requests failed")
+        return results
+
+    @cached_property
+    def client(self):
+        """创建客户端时一次性安装 Azure 请求包装（客户端被释放后重建时会重新安装）"""
+        client = super().client
+        self._original_create = client.chat.completions.create
+        client.chat.completions.create = self._azure_create
+        return client
+
+    def _azure_create(self, **create_kwargs):
+        # 确保使用正确的 Azure 部署名称，而不是 DataDreamer 兼容名称
+        create_kwargs['model'] = self.deployment_name
+
+        # 添加 Azure 特定的参数
+        if 'extra_headers' not in create_kwargs:
+            create_kwargs['extra_headers'] = {}
+
+        create_kwargs['extra_headers']['api-version'] = self.api_version
+
+        # GPT-4.1 特殊处理
+        if "gpt-4.1" in self._original_model_name:
+            # GPT-4.1 支持更大的上下文窗口，默认可以使用更多 tokens
+            if 'max_tokens' not in create_kwargs:
+                create_kwargs['max_tokens'] = 4096
+
+            logger.debug(f"GPT-4.1 request: deployment={self.deployment_name}, "
+                       f"max_tokens={create_kwargs.get('max_tokens')}")
+
+        logger.debug(f"Azure OpenAI request: deployment={self.deployment_name}, "
+                   f"api-version={self.api_version}, original_model={self._original_model_name}")
+
+        try:
+            return self._original_create(**create_kwargs)
+        except Exception as e:
+            return self._handle_create_error(e, create_kwargs)
+
+    def _handle_create_error(self, e, create_kwargs):
+        # 如果是认证错误，尝试刷新令牌
+        if "401" in str(e) or "Unauthorized" in str(e):
+            logger.warning("Authentication failed, refreshing token...")
+            self._refresh_client_token(force=True)
+            create_kwargs['extra_headers']['Authorization'] = f"Bearer {self.token_manager.get_token()}"
+            return self._original_create(**create_kwargs)
+        # 如果是模型不存在的错误，给出更有用的错误信息
+        elif "DeploymentNotFound" in str(e) or "NotFound" in str(e):
+            logger.error(f"Deployment '{self.deployment_name}' not found. "
+                       f"Please check your Azure OpenAI deployment configuration.")
+            raise ValueError(f"Azure deployment '{self.deployment_name}' for model "
+                           f"'{self._original_model_name}' not found. Please check your "
+                           f"deployment configuration in the Azure portal.")
+        else:
+            raise e
+
     def run(self, prompts, **kwargs):
         """重写 run 方法以处理 Azure 特定的逻辑和 GPT-4.1 支持"""
 
+        # 大量离线 prompt 可选择走 Batch API（不经过 DataDreamer 的缓存）
+        use_batch_api = kwargs.pop("use_batch_api", self.use_batch_api)
+        if use_batch_api:
+            # Prompt 步骤传入的是迭代器，先取出全部 prompt 才能判断数量
+            prompts = list(prompts)
+            if len(prompts) < BATCH_API_MIN_PROMPTS:
+                logger.warning(f"Only {len(prompts)} prompts (< {BATCH_API_MIN_PROMPTS}), "
+                               f"using the realtime API instead of the Batch API")
+                use_batch_api = False
+        if use_batch_api:
+            results = self.run_batch(
+                prompts,
+                max_new_tokens=kwargs.get("max_new_tokens"),
+                temperature=kwargs.get("temperature", 1.0),
+                top_p=kwargs.get("top_p", 0.0),
+            )
+            return iter(results) if kwargs.get("return_generator") else results
+
+        # 可选：把多个短 prompt 合并到一个请求中，减少 API 调用次数
+        pack_size = min(kwargs.pop("pack_size", self.pack_size), PACK_MAX_SIZE)
+        if pack_size > 1 and kwargs.get("n", 1) == 1:
+            # Prompt 步骤传入的是迭代器，分组前先取出全部 prompt
+            prompts = list(prompts)
+            return_generator = kwargs.pop("return_generator", False)
+            results = self._run_packed(prompts, pack_size, **kwargs)
+            return iter(results) if return_generator else results
+
         # 确保令牌是最新的
         self._refresh_client_token()
 
-        # 获取原始的 create 方法
-        if hasattr(self.client.chat.completions, 'create'):
-            original_create = self.client.chat.completions.create
-
-            def azure_create(**create_kwargs):
-                # 确保使用正确的 Azure 部署名称，而不是 DataDreamer 兼容名称
-                create_kwargs['model'] = self.deployment_name
-
-                # 添加 Azure 特定的参数
-                if 'extra_headers' not in create_kwargs:
-                    create_kwargs['extra_headers'] = {}
-
-                create_kwargs['extra_headers']['api-version'] = self.api_version
-
-                # GPT-4.1 特殊处理
-                if "gpt-4.1" in self._original_model_name:
-                    # GPT-4.1 支持更大的上下文窗口和特殊参数
-                    if 'max_tokens' not in create_kwargs:
-                        # GPT-4.1 默认可以使用更多 tokens
-                        create_kwargs['max_tokens'] = min(8192, kwargs.get("max_tokens", 4096))
-
-                    # 可能的 GPT-4.1 特定参数
-                    if 'reasoning_effort' in kwargs:
-                        create_kwargs['reasoning_effort'] = kwargs['reasoning_effort']
-
-                    logger.debug(f"GPT-4.1 request: deployment={self.deployment_name}, "
-                               f"max_tokens={create_kwargs.get('max_tokens')}")
-
-                logger.debug(f"Azure OpenAI request: deployment={self.deployment_name}, "
-                           f"api-version={self.api_version}, original_model={self._original_model_name}")
-
-                try:
-                    return original_create(**create_kwargs)
-                except Exception as e:
-                    # 如果是认证错误，尝试刷新令牌
-                    if "401" in str(e) or "Unauthorized" in str(e):
-                        logger.warning("Authentication failed, refreshing token...")
-                        self._refresh_client_token()
-                        create_kwargs['extra_headers']['Authorization'] = f"Bearer {self.token_manager.get_token()}"
-                        return original_create(**create_kwargs)
-                    # 如果是模型不存在的错误，给出更有用的错误信息
-                    elif "DeploymentNotFound" in str(e) or "NotFound" in str(e):
-                        logger.error(f"Deployment '{self.deployment_name}' not found. "
-                                   f"Please check your Azure OpenAI deployment configuration.")
-                        raise ValueError(f"Azure deployment '{self.deployment_name}' for model "
-                                       f"'{self._original_model_name}' not found. Please check your "
-                                       f"deployment configuration in the Azure portal.")
-                    else:
-                        raise
-
-            # 临时替换方法
-            self.client.chat.completions.create = azure_create
+        # 请求包装已在创建客户端时安装
+        return super().run(prompts, **kwargs)
 
-            try:
-                # 调用父类的 run 方法
-                result = super().run(prompts, **kwargs)
-                return result
-            finally:
-                # 恢复原始方法
-                self.client.chat.completions.create = original_create
-        else:
-            # 备用方案
-            return super().run(prompts, **kwargs)
+    def _run_packed(self, prompts, pack_size, **kwargs):
+        """合并短 prompt 生成；过长的 prompt 以及无法拆分回复的组按单个 prompt 重新生成"""
+        self._refresh_client_token()
+
+        packable = [i for i, prompt in enumerate(prompts) if self.count_tokens(prompt) <= PACK_MAX_PROMPT_TOKENS]
+        packable_set = set(packable)
+        unpacked = [i for i in range(len(prompts)) if i not in packable_set]
+        groups = [packable[j:j + pack_size] for j in range(0, len(packable), pack_size)]
+
+        # 进度按每次实际请求的数量计算
+        kwargs.pop("total_num_prompts", None)
+        results = [None] * len(prompts)
+        if groups:
+            packed_kwargs = dict(kwargs)
+            if packed_kwargs.get("max_new_tokens") is not None:
+                packed_kwargs["max_new_tokens"] *= pack_size
+            responses = super().run([_marshal([prompts[i] for i in group]) for group in groups], **packed_kwargs)
+            for group, response in zip(groups, responses):
+                answers = _unmarshal(response, len(group))
+                if answers is None:
+                    unpacked.extend(group)
+                    continue
+                for i, answer in zip(group, answers):
+                    results[i] = answer
+
+        if unpacked:
+            unpacked.sort()
+            logger.info(f"Generating {len(unpacked)} of {len(prompts)} prompts individually")
+            for i, result in zip(unpacked, super().run([prompts[i] for i in unpacked], **kwargs)):
+                results[i] = result
+        return results
+
+    def run_stream(self, prompt, max_new_tokens=None, temperature=1.0, top_p=0.0):
+        """
+        流式生成单个 prompt，逐段 yield 文本，调用方无需等待完整回复即可开始处理
+        （不经过 DataDreamer 的缓存；批量生成仍使用 run）
+        """
+        self._refresh_client_token()
+        create_kwargs = {
+            "model": self.deployment_name,
+            "messages": self._build_messages(prompt),
+            "temperature": temperature,
+            "top_p": top_p,
+            "stream": True,
+        }
+        if max_new_tokens is not None:
+            create_kwargs["max_tokens"] = max_new_tokens
+
+        for chunk in self.client.chat.completions.create(**create_kwargs):
+            # Azure 会发送不含 choices 的内容过滤结果块
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # 原始 create 方法绑定在客户端上，随客户端一起重建
+        state.pop("_original_create", None)
+        return state
 
     @property
     def original_model_name(self):
@@ -3,13 +3,18 @@ DataDreamer patch to fix num_proc errors
 """
 
 import os
+import multiprocessing
 import warnings
 
-# Force disable all multiprocessing
-os.environ['DATADREAMER_DISABLE_MULTIPROCESSING'] = '1'
 os.environ['DATASETS_DISABLE_MULTIPROCESSING'] = '1'
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 
+# Under "spawn" (macOS/Windows default) map workers re-import the caller and need picklable
+# closures, which is where the num_proc errors came from; with fork, a map whose caller asks
+# for several processes (e.g. save_num_proc > 1) may use up to this many.
+_START_METHOD = multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]
+MAP_NUM_PROC = 1 if _START_METHOD == 'spawn' else min(os.cpu_count() or 1, 8)
+
 # Patch datasets library to avoid num_proc issues
 try:
     import datasets.arrow_dataset
@@ -18,9 +23,11 @@ try:
     _original_map = datasets.arrow_dataset.Dataset.map
 
     def patched_map(self, function, *args, **kwargs):
-        # Remove any num_proc related arguments
+        # DataDreamer's map steps and dataset_zip always pass num_proc (1 by default); stay
+        # serial unless the caller asked for more, and only parallelize where forking is available
         if 'num_proc' in kwargs:
-            kwargs['num_proc'] = 1
+            requested = kwargs['num_proc'] or 1
+            kwargs['num_proc'] = min(requested, MAP_NUM_PROC, max(len(self), 1))
         if 'save_num_proc' in kwargs:
             del kwargs['save_num_proc']
 
@@ -32,23 +39,4 @@ try:
 except ImportError:
     pass
 
-# Patch datadreamer to avoid multiprocessing issues
-try:
-    import datadreamer.steps.step
-
-    # Override default num_proc behavior
-    original_init = datadreamer.steps.step.Step.__init__
-
-    def patched_init(self, *args, **kwargs):
-        result = original_init(self, *args, **kwargs)
-        # Force disable multiprocessing for all steps
-        if hasattr(self, '_dataset_map_kwargs'):
-            self._dataset_map_kwargs['num_proc'] = 1
-        return result
-
-    datadreamer.steps.step.Step.__init__ = patched_init
-
-except ImportError:
-    pass
-
 print("✅ DataDreamer multiprocessing patches applied")
\ No newline at end of file
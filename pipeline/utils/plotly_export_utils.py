@@ -4,10 +4,29 @@ Utility functions for Plotly image export with fallback options
 
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io.kaleido as pio_kaleido
 from PIL import Image
 from io import BytesIO
+import threading
 import warnings
 
+# Kaleido keeps one persistent Chromium subprocess per scope; reuse it for every export.
+# None when kaleido isn't installed.
+KALEIDO_SCOPE = getattr(pio_kaleido, "scope", None)
+
+# Trace types plotly_to_matplotlib_fallback can draw
+MATPLOTLIB_TRACE_TYPES = {'scatter', 'bar'}
+
+# Kaleido is treated as broken in this process after this many figures in a row fail to
+# export; a single figure Kaleido can't handle doesn't disable it
+KALEIDO_MAX_CONSECUTIVE_FAILURES = 5
+
+# Number of figures in a row that all Kaleido export methods failed on (reset on success)
+_kaleido_failures = 0
+
+# Per-thread PNG buffer reused by the write_image export method
+_TLS = threading.local()
+
 
 def safe_plotly_to_image(fig, width=800, height=600):
     """
@@ -21,17 +40,55 @@ def safe_plotly_to_image(fig, width=800, height=600):
     Returns:
         PIL Image object or None if all methods fail
     """
+    global _kaleido_failures
+
+    # Once Kaleido keeps failing in this process, send figures matplotlib can draw
+    # straight to the fallback instead of retrying the Kaleido methods
+    kaleido_broken = _kaleido_failures >= KALEIDO_MAX_CONSECUTIVE_FAILURES
+    if kaleido_broken and all(trace.type in MATPLOTLIB_TRACE_TYPES for trace in fig.data):
+        try:
+            return plotly_to_matplotlib_fallback(fig)
+        except Exception:
+            return None
+
+    image = _kaleido_to_image(fig, width, height)
+    if image is not None:
+        _kaleido_failures = 0
+        return image
+    _kaleido_failures += 1
+
+    # Method 4: Use matplotlib as fallback (only for simple charts)
+    try:
+        return plotly_to_matplotlib_fallback(fig)
+    except Exception:
+        pass
+
+    return None
+
+
+def _kaleido_to_image(fig, width, height):
+    """Try the Kaleido export methods in order; returns None if all of them fail."""
 
     # Method 1: Try standard to_image with explicit parameters
     try:
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            img_bytes = fig.to_image(
-                format='png',
-                width=width,
-                height=height,
-                scale=2.0
-            )
+            if KALEIDO_SCOPE is not None:
+                # Call the shared scope directly instead of going through fig.to_image
+                img_bytes = KALEIDO_SCOPE.transform(
+                    fig.to_dict(),
+                    format='png',
+                    width=width,
+                    height=height,
+                    scale=2.0
+                )
+            else:
+                img_bytes = fig.to_image(
+                    format='png',
+                    width=width,
+                    height=height,
+                    scale=2.0
+                )
             return Image.open(BytesIO(img_bytes))
     except Exception:
         pass
@@ -49,16 +106,15 @@ def safe_plotly_to_image(fig, width=800, height=600):
     try:
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            img_io = BytesIO()
+            img_io = getattr(_TLS, 'buf', None)
+            if img_io is None:
+                img_io = _TLS.buf = BytesIO()
+            img_io.seek(0)
+            img_io.truncate(0)
             fig.write_image(img_io, format='png')
             img_io.seek(0)
-            return Image.open(img_io)
-    except Exception:
-        pass
-
-    # Method 4: Use matplotlib as fallback (only for simple charts)
-    try:
-        return plotly_to_matplotlib_fallback(fig)
+            # copy() decodes the image so the buffer can be reused by the next call
+            return Image.open(img_io).copy()
     except Exception:
         pass
 
@@ -75,7 +131,7 @@ def plotly_to_matplotlib_fallback(fig):
     import matplotlib.pyplot as plt
 
     # Create matplotlib figure
-    plt.figure(figsize=(8, 6))
+    mpl_fig = plt.figure(figsize=(8, 6))
 
     # Extract data from plotly figure
     for trace in fig.data:
@@ -94,13 +150,15 @@ def plotly_to_matplotlib_fallback(fig):
     if fig.layout.yaxis and fig.layout.yaxis.title:
         plt.ylabel(fig.layout.yaxis.title.text if hasattr(fig.layout.yaxis.title, 'text') else str(fig.layout.yaxis.title))
 
-    # Save to BytesIO
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', bbox_inches='tight')
-    plt.close()
+    # Read the rendered RGBA pixels straight from the Agg canvas (no PNG encode/decode)
+    mpl_fig.tight_layout()
+    mpl_fig.canvas.draw()
+    image = Image.frombuffer(
+        'RGBA', mpl_fig.canvas.get_width_height(), mpl_fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1
+    ).copy()
+    plt.close(mpl_fig)
 
-    img_buffer.seek(0)
-    return Image.open(img_buffer)
+    return image
 
 
 # Template for safe plotly image generation
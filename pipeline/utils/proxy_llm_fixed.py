@@ -4,11 +4,14 @@ Fixed Proxy LLM support for DataDreamer compatibility
 
 import os
 import json
+from functools import cached_property
 from datadreamer.llms import OpenAI
 from datadreamer.llms.openai import _is_chat_model
 from dotenv import load_dotenv
 import logging
 
+from .proxy_messages import normalize_messages
+
 # Load environment variables
 load_dotenv()
 
@@ -19,6 +22,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_CLAUDE_PATCHED = False
+
+# Request parameters forwarded to Claude through the proxy, and their defaults
+_CLAUDE_ALLOWED = ('model', 'messages', 'temperature', 'max_tokens')
+_CLAUDE_DEFAULTS = {'messages': [], 'temperature': 1.0, 'max_tokens': 100}
+
+
+def _apply_claude_patch():
+    """Make DataDreamer treat Claude models as chat models (applied once per process)."""
+    global _CLAUDE_PATCHED
+    if _CLAUDE_PATCHED:
+        return
+
+    import datadreamer.llms.openai
+
+    def patched_is_chat_model(model_name):
+        if "claude" in model_name.lower():
+            return True
+        return _is_chat_model(model_name)
+
+    datadreamer.llms.openai._is_chat_model = patched_is_chat_model
+    _CLAUDE_PATCHED = True
+
 
 class ProxyLLM(OpenAI):
     """
@@ -41,19 +67,7 @@ class ProxyLLM(OpenAI):
 
         # Force chat model detection for Claude
         if "claude" in model_name.lower():
-            # Override the _is_chat_model function to return True for Claude
-            import datadreamer.llms.openai
-            original_is_chat_model = datadreamer.llms.openai._is_chat_model
-
-            def patched_is_chat_model(model_name):
-                if "claude" in model_name.lower():
-                    return True
-                return original_is_chat_model(model_name)
-
-            datadreamer.llms.openai._is_chat_model = patched_is_chat_model
-            # Clear the lru_cache if it exists
-            if hasattr(original_is_chat_model, 'cache_clear'):
-                original_is_chat_model.cache_clear()
+            _apply_claude_patch()
 
         # Initialize parent class
         super().__init__(
@@ -77,64 +91,37 @@ class ProxyLLM(OpenAI):
         # Parent class tries to set this, but we use our own storage
         pass
 
-    def run(self, prompts, **kwargs):
-        """Override run method to ensure proper request formatting."""
-        # Patch the chat.completions.create to use correct model name and filter params
-        if hasattr(self.client, 'chat') and hasattr(self.client.chat, 'completions'):
-            original_create = self.client.chat.completions.create
-
-            def patched_create(**create_kwargs):
-                # Ensure model name is correct
-                create_kwargs['model'] = self._proxy_model_name
-
-                # Filter parameters for Claude
-                if "claude" in self._proxy_model_name.lower():
-                    # Log the request for debugging
-                    logger.info(f"=== Claude Chat Request ===")
-                    logger.info(f"Model: {create_kwargs.get('model')}")
-                    logger.info(f"Parameters: {list(create_kwargs.keys())}")
-
-                    # Only keep essential parameters
-                    filtered = {
-                        'model': create_kwargs['model'],
-                        'messages': create_kwargs.get('messages', []),
-                        'temperature': create_kwargs.get('temperature', 1.0),
-                        'max_tokens': create_kwargs.get('max_tokens', 100)
-                    }
-                    create_kwargs = filtered
-
-                # Fix messages format if needed
-                if 'messages' in create_kwargs and isinstance(create_kwargs['messages'], list):
-                    fixed_messages = []
-                    for msg in create_kwargs['messages']:
-                        fixed_msg = {'role': str(msg.get('role', 'user'))}
-                        content = msg.get('content', '')
-                        if isinstance(content, list):
-                            # Convert array to string
-                            text_parts = []
-                            for part in content:
-                                if isinstance(part, dict) and 'text' in part:
-                                    text_parts.append(part['text'])
-                                else:
-                                    text_parts.append(str(part))
-                            fixed_msg['content'] = ' '.join(text_parts)
-                        else:
-                            fixed_msg['content'] = str(content)
-                        fixed_messages.append(fixed_msg)
-                    create_kwargs['messages'] = fixed_messages
-
-                return original_create(**create_kwargs)
-
-            # Temporarily replace the method
-            self.client.chat.completions.create = patched_create
-
-            try:
-                # Call parent run method
-                result = super().run(prompts, **kwargs)
-                return result
-            finally:
-                # Restore original method
-                self.client.chat.completions.create = original_create
-        else:
-            # Fallback to parent implementation
-            return super().run(prompts, **kwargs)
\ No newline at end of file
+    @cached_property
+    def client(self):
+        """Install the request wrapper once, when the client is created (and again if it is rebuilt)."""
+        client = super().client
+        self._original_create = client.chat.completions.create
+        client.chat.completions.create = self._patched_create
+        return client
+
+    def _patched_create(self, **create_kwargs):
+        # Ensure model name is correct
+        create_kwargs['model'] = self._proxy_model_name
+
+        # Filter parameters for Claude
+        if "claude" in self._proxy_model_name.lower():
+            # Log the request for debugging (skipped entirely when INFO is disabled)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("=== Claude Chat Request ===")
+                logger.info("Model: %s", create_kwargs.get('model'))
+                logger.info("Parameters: %s", list(create_kwargs.keys()))
+
+            # Only keep essential parameters
+            create_kwargs = {k: create_kwargs.get(k, _CLAUDE_DEFAULTS.get(k)) for k in _CLAUDE_ALLOWED}
+
+        # Fix messages format if needed
+        if 'messages' in create_kwargs and isinstance(create_kwargs['messages'], list):
+            create_kwargs['messages'] = normalize_messages(create_kwargs['messages'])
+
+        return self._original_create(**create_kwargs)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # The original create method is bound to the client, which is rebuilt after unpickling
+        state.pop("_original_create", None)
+        return state
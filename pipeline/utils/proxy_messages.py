@@ -0,0 +1,30 @@
+"""
+Chat message normalization shared by the proxy LLM wrappers
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_messages(messages):
+    """Flatten list-style message content into plain strings in a single pass."""
+    # Plain-text prompts (the common case) are already in the right shape
+    if all(isinstance(msg.get("role"), str) and isinstance(msg.get("content"), str) for msg in messages):
+        return messages
+
+    fixed_messages = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if isinstance(content, list):
+            logger.debug("Flattening list content in message: %s", content)
+            # Convert array content to string, skipping dict parts without text
+            content = " ".join(
+                str(part["text"]) if isinstance(part, dict) else str(part)
+                for part in content
+                if not isinstance(part, dict) or "text" in part
+            )
+        elif not isinstance(content, str):
+            content = str(content)
+        fixed_messages.append({"role": str(msg.get("role", "user")), "content": content})
+    return fixed_messages
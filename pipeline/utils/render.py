@@ -3,6 +3,7 @@ import re
 import random
 import subprocess
 import tempfile
+import time
 from io import BytesIO
 from shutil import rmtree
 from PIL import ImageOps, Image
@@ -153,7 +154,18 @@ def render_screen(html, full_page=True, random_width=True):
     return image
 
 
-def render_latex(latex_source):
+def render_latex(latex_source, timeout=None):
+    # One deadline covers every compiler attempt and the PDF-to-image conversion
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining_time():
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired("render_latex", timeout)
+        return remaining
+
     def compile_latex(compiler, latex_file, temp_dir):
         process = subprocess.Popen(
             [
@@ -166,81 +178,89 @@ def render_latex(latex_source):
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
         )
-        stdout, stderr = process.communicate()
+        try:
+            stdout, stderr = process.communicate(timeout=remaining_time())
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
         return process.returncode, stdout
 
     # Create temporary directory
     temp_dir = tempfile.mkdtemp()
-
-    # Prepare paths
-    latex_file = os.path.join(temp_dir, "temp.tex")
-    pdf_file = os.path.join(temp_dir, "temp.pdf")
-
-    # Write LaTeX content to a file
-    with open(latex_file, "w", encoding="utf-8") as f:
-        f.write(latex_source)
-
-    # Try to compile with pdflatex, xelatex, and lualatex
-    compilers = ["pdflatex", "xelatex", "lualatex"]
-    for compiler in compilers:
-        returncode, stdout = compile_latex(compiler, latex_file, temp_dir)
-        if returncode == 0:
-            break
-    else:
-        rmtree(temp_dir, ignore_errors=True)
-        raise RuntimeError(f'Error encountered during LaTeX rendering with all compilers:\n{stdout.decode("utf-8")}')
-
-    # Convert PDF bytes to images using pdf2image
     try:
-        images = convert_from_bytes(open(pdf_file, "rb").read())
-    except Exception as e:
-        print(f"⚠️  pdf2image failed (probably missing pdftoppm): {e}")
-        print("Trying alternative method with PIL...")
+        # Prepare paths
+        latex_file = os.path.join(temp_dir, "temp.tex")
+        pdf_file = os.path.join(temp_dir, "temp.pdf")
+
+        # Write LaTeX content to a file
+        with open(latex_file, "w", encoding="utf-8") as f:
+            f.write(latex_source)
+
+        # Try to compile with pdflatex, xelatex, and lualatex
+        compilers = ["pdflatex", "xelatex", "lualatex"]
+        for compiler in compilers:
+            returncode, stdout = compile_latex(compiler, latex_file, temp_dir)
+            if returncode == 0:
+                break
+        else:
+            raise RuntimeError(f'Error encountered during LaTeX rendering with all compilers:\n{stdout.decode("utf-8")}')
 
-        # Fallback: Try to use ImageMagick or create a placeholder
+        # Convert PDF bytes to images using pdf2image
         try:
-            # Try ImageMagick convert command
-            png_file = os.path.join(temp_dir, "temp.png")
-            result = subprocess.run(
-                ["convert", "-density", "300", pdf_file, png_file],
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode == 0 and os.path.exists(png_file):
-                from PIL import Image
-                images = [Image.open(png_file)]
-            else:
-                raise Exception("ImageMagick conversion failed")
-
-        except Exception:
-            # Final fallback: Create a placeholder image
-            print("Creating placeholder image...")
-            from PIL import Image, ImageDraw, ImageFont
-            img = Image.new('RGB', (800, 600), color='white')
-            draw = ImageDraw.Draw(img)
-
-            # Add text to indicate the issue
-            text = "LaTeX rendered successfully\nPDF created but cannot convert to image\nInstall poppler-utils for proper rendering"
+            images = convert_from_bytes(open(pdf_file, "rb").read(), timeout=remaining_time())
+        except subprocess.TimeoutExpired:
+            raise
+        except Exception as e:
+            print(f"⚠️  pdf2image failed (probably missing pdftoppm): {e}")
+            print("Trying alternative method with PIL...")
+
+            # Fallback: Try to use ImageMagick or create a placeholder
+            convert_timeout = remaining_time()
             try:
-                # Try to use a basic font
-                font = ImageFont.load_default()
-                draw.multiline_text((50, 200), text, fill='black', font=font)
-            except:
-                draw.multiline_text((50, 200), text, fill='black')
-
-            images = [img]
-
-    # Cleanup temporary files (optional)
-    os.remove(latex_file)
-    os.remove(pdf_file)
-    rmtree(temp_dir, ignore_errors=True)
-
-    # Return the PIL image (assuming single-page PDF)
-    if images:
-        return crop_whitespace(images[0])  # Return the first page as a PIL image
-
-    raise RuntimeError("PDF did not generate anything.")
+                # Try ImageMagick convert command
+                png_file = os.path.join(temp_dir, "temp.png")
+                result = subprocess.run(
+                    ["convert", "-density", "300", pdf_file, png_file],
+                    capture_output=True,
+                    text=True,
+                    timeout=convert_timeout,
+                )
+
+                if result.returncode == 0 and os.path.exists(png_file):
+                    from PIL import Image
+                    images = [Image.open(png_file)]
+                else:
+                    raise Exception("ImageMagick conversion failed")
+
+            except subprocess.TimeoutExpired:
+                raise
+            except Exception:
+                # Final fallback: Create a placeholder image
+                print("Creating placeholder image...")
+                from PIL import Image, ImageDraw, ImageFont
+                img = Image.new('RGB', (800, 600), color='white')
+                draw = ImageDraw.Draw(img)
+
+                # Add text to indicate the issue
+                text = "LaTeX rendered successfully\nPDF created but cannot convert to image\nInstall poppler-utils for proper rendering"
+                try:
+                    # Try to use a basic font
+                    font = ImageFont.load_default()
+                    draw.multiline_text((50, 200), text, fill='black', font=font)
+                except:
+                    draw.multiline_text((50, 200), text, fill='black')
+
+                images = [img]
+
+        # Return the PIL image (assuming single-page PDF); crop before the temp dir is removed
+        if images:
+            return crop_whitespace(images[0])  # Return the first page as a PIL image
+
+        raise RuntimeError("PDF did not generate anything.")
+    finally:
+        # Cleanup temporary files, also on compiler errors and timeouts
+        rmtree(temp_dir, ignore_errors=True)
 
 
 def render_vegalite(vegalite_json):
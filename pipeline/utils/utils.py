@@ -5,7 +5,7 @@ import random
 import numpy as np
 import pandas as pd
 from PIL import Image, ImageColor, ImageDraw
-from io import StringIO
+from io import BytesIO, StringIO
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from threadpoolctl import threadpool_limits
@@ -87,14 +87,25 @@ def extract_schemdraw_code(input_string):
             return None
 
 
+LATEX_FENCE = re.compile(r"```(?:latex|tex)?", re.IGNORECASE)
+LATEX_CODE = re.compile(r"```latex(.*)```", re.DOTALL)
+ANY_CODE = re.compile(r"```(.*)```", re.DOTALL)
+LATEX_CODE_BLOCKS = re.compile(r"```(?:latex)?(.*?)```", re.DOTALL)
+
+
 def extract_latex(input_string):
+    # cheap gate: responses without any code fence (errors, empty strings) have no code
+    if not input_string or not LATEX_FENCE.search(input_string):
+        print("No valid code found")
+        return None
+
     # extract code from the input string
-    code_match = re.search(r"```latex(.*)```", input_string, re.DOTALL)
+    code_match = LATEX_CODE.search(input_string)
     if code_match:
         extracted_code = code_match.group(1).strip()
         return extracted_code
     else:
-        code_match = re.search(r"```(.*)```", input_string, re.DOTALL)
+        code_match = ANY_CODE.search(input_string)
         if code_match:
             extracted_code = code_match.group(1).strip()
             return extracted_code
@@ -103,6 +114,14 @@ def extract_latex(input_string):
             return None
 
 
+def extract_latex_blocks(input_string):
+    # extract every code block from the input string, in order
+    return [
+        code.strip()
+        for code in LATEX_CODE_BLOCKS.findall(input_string or "")
+    ]
+
+
 def extract_svg(input_string):
     # extract code from the input string
     code_match = re.search(r"```svg(.*)```", input_string, re.DOTALL)
@@ -371,26 +390,24 @@ def extract_point_html(input_string):
 
 def compute_white_px_ratio(image):
     # Compute the ratio of white pixels in the image
-    white_px = 0
-    total_px = 0
-    for px in image.getdata():
-        if px == (255, 255, 255):
-            white_px += 1
-        total_px += 1
-    return white_px / total_px
+    # only 3-band pixels can equal (255, 255, 255); other modes have no white pixels
+    if len(image.getbands()) != 3:
+        return 0.0
+    arr = np.asarray(image)
+    return float(np.all(arr == 255, axis=-1).mean())
 
 
 def compute_major_px_ratio(image):
     # Compute the ratio of the most common pixel in the image
-    px_count = {}
-    for px in image.getdata():
-        if px in px_count:
-            px_count[px] += 1
-        else:
-            px_count[px] = 1
-
-    max_px = max(px_count, key=px_count.get)
-    return px_count[max_px] / len(image.getdata())
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        # pack each pixel's channels into one integer so pixels can be counted in a single pass
+        packed = np.zeros(arr.shape[:2], dtype=np.uint32)
+        for channel in range(arr.shape[2]):
+            packed = (packed << 8) | arr[..., channel]
+        arr = packed
+    _, counts = np.unique(arr.ravel(), return_counts=True)
+    return counts.max() / arr.size
 
 
 def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_ratio_threshold=None, filter_small=True):
@@ -425,6 +442,16 @@ def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_
     return image_from_byte_array
 
 
+def encode_png(image):
+    # Encode once into the {"bytes", "path"} form that datasets.Image stores as-is,
+    # so saving and publishing the dataset don't re-encode the image
+    if image is None:
+        return None
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=False)
+    return {"bytes": buffer.getvalue(), "path": None}
+
+
 def fix_latex_white_text(code):
     RGB_replacements = ["{128,128,128}",
                         "{41,128,185}",
@@ -621,6 +648,12 @@ def draw_points(image, list_of_points):
     return image
 
 
+def output_to_rows(output):
+    # read a step output back column-wise from its Arrow table instead of row by row
+    columns = output.dataset.to_dict()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
 if __name__ == "__main__":
     # Test the image processing function
     image = Image.open("1.png")
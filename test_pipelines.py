@@ -1,26 +1,30 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import subprocess
 import shutil
+import selectors
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
 
 # Add project to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from worker_protocol import WORKER_DONE
+
 # Disable all caching to avoid pickle issues
 os.environ['DATADREAMER_DISABLE_CACHE'] = '1'
 os.environ['TRANSFORMERS_OFFLINE'] = '0'
 os.environ['HF_DATASETS_OFFLINE'] = '0'
 
-# Disable multiprocessing in DataDreamer to avoid num_proc errors
-os.environ['DATADREAMER_DISABLE_MULTIPROCESSING'] = '1'
+# Disable multiprocessing in datasets to avoid num_proc errors
 os.environ['DATASETS_DISABLE_MULTIPROCESSING'] = '1'
 
-# Clean any existing cache before starting
-if os.path.exists('./session_output/.cache'):
-    shutil.rmtree('./session_output/.cache')
+# Use 1 MiB chunks when shutil has to fall back to a userspace read/write copy loop
+shutil.COPY_BUFSIZE = 1 << 20
 
 # 测试配置
 test_configs = [
@@ -56,84 +60,318 @@ test_configs = [
     }
 ]
 
+# 每个管道使用独立的 DataDreamer 输出目录：同时运行的 main.py 都会创建同名的
+# "Combine results from all pipelines" 步骤，共用一个目录会互相覆盖/删除
+# session 目录名由步骤名 session_dir 转换而来（例如 Generate_LaTeX_Diagrams -> generate-latex-diagrams）
+for config in test_configs:
+    config['output_folder'] = os.path.join("./session_output", f"{config['output_dir']}_test")
+    config['session_path'] = os.path.join(config['output_folder'], config['session_dir'].lower().replace('_', '-'))
+
+# Clean any existing cache before starting: move it out of the way (a cheap rename) and
+# delete it in the background while the pipelines run
+stale_caches = []
+for output_folder in ['./session_output'] + [config['output_folder'] for config in test_configs]:
+    cache_dir = os.path.join(output_folder, '.cache')
+    if os.path.exists(cache_dir):
+        stale_cache = f'{cache_dir}.old.{os.getpid()}'
+        os.rename(cache_dir, stale_cache)
+        stale_caches.append(stale_cache)
+cache_cleaner = None
+if stale_caches:
+    cache_cleaner = threading.Thread(
+        target=lambda: [shutil.rmtree(path, ignore_errors=True) for path in stale_caches], daemon=True
+    )
+    cache_cleaner.start()
+
+# 用当前解释器运行 main.py（不经过 PATH 查找 python，也不会在 venv 中用错解释器）
+MAIN_COMMAND = (sys.executable, "main.py")
+
+# 设为 1 时在一个常驻的 main.py --server 进程中依次运行所有管道（只付一次启动开销，但不再并行）
+PIPELINE_WORKER = os.environ.get('PIPELINE_WORKER') == '1'
+
+# 并行复制文件的线程数（复制时主要在内核中等待 I/O，不受 GIL 限制）
+COPY_WORKERS = 8
+
+# 设为 1 时把生成的文件移动到 examples（session 目录不再保留这些文件）
+MOVE_ARTIFACTS = os.environ.get('MOVE_ARTIFACTS') == '1'
+
 # 创建 examples 目录
-examples_dir = Path("./examples")
-examples_dir.mkdir(exist_ok=True)
+examples_dir = "./examples"
+os.makedirs(examples_dir, exist_ok=True)
 
-# 运行测试
-for config in test_configs:
-    print(f"\n{'='*50}")
-    print(f"Testing {config['pipeline']}...")
-    print(f"{'='*50}")
 
-    # 创建输出目录
-    output_path = examples_dir / config['output_dir']
-    output_path.mkdir(exist_ok=True)
+# 小于该大小的文件（大部分 HTML/JSON）一次读入、一次写出
+SMALL_FILE_SIZE = 64 * 1024
+
+# 大文件复制前后给内核的缓存提示（非 Linux 平台没有 posix_fadvise）
+HAS_FADVISE = hasattr(os, "posix_fadvise")
+
 
-    # 运行管道
-    cmd = [
-        "python", "main.py",
+def fast_copy(src, dst):
+    """
+    复制文件并保留元数据。小文件一次 read/write 完成；大文件优先使用 os.copy_file_range
+    （btrfs/xfs 上可直接共享数据块），不支持时退回 shutil.copy2（Linux 上已使用 sendfile）
+    """
+    if os.path.getsize(src) < SMALL_FILE_SIZE:
+        with open(src, 'rb') as fsrc:
+            data = fsrc.read()
+        # 带缓冲的写入保证写完全部数据（无缓冲的 write 可能只写入一部分）
+        with open(dst, 'wb') as fdst:
+            fdst.write(data)
+        shutil.copystat(src, dst)
+        return
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                if HAS_FADVISE:
+                    # 源文件只顺序读一遍：加大预读
+                    os.posix_fadvise(fsrc.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if HAS_FADVISE:
+                    # 本脚本不会再读目标文件，已写回磁盘的页可以从页缓存中释放
+                    os.posix_fadvise(fdst.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            if remaining == 0:
+                shutil.copystat(src, dst)
+                return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def same_content(src, dst):
+    """
+    判断目标文件是否已与源文件相同：同一 inode、或大小和修改时间都相同（fast_copy 会保留
+    修改时间）时直接认为相同，否则按 1 MiB 分块逐块比较，遇到第一个不同的块即返回
+    """
+    try:
+        src_stat, dst_stat = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if os.path.samestat(src_stat, dst_stat) or src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+
+    with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
+        while True:
+            src_chunk = fsrc.read(1 << 20)
+            if src_chunk != fdst.read(1 << 20):
+                return False
+            if not src_chunk:
+                return True
+
+
+def move_or_copy(src, dst):
+    """
+    同一文件系统上用硬链接代替复制（MOVE_ARTIFACTS=1 时直接移动），只更新元数据；
+    跨文件系统（EXDEV）或不支持硬链接时退回 fast_copy。目标已是相同内容时什么都不做。
+    硬链接与 session 输出共享同一份数据，examples 中的文件只供查看，不应被原地修改
+    """
+    if same_content(src, dst):
+        return
+    try:
+        if MOVE_ARTIFACTS:
+            os.replace(src, dst)
+            return
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+        return
+    except (OSError, NotImplementedError):
+        pass
+    fast_copy(src, dst)
+
+
+def pipeline_args(config):
+    """运行单个管道的 main.py 参数"""
+    return [
         "-p", config['pipeline'],
         "-n", "3",
         "-t", config['types'],
         "-m", f"{config['output_dir']}_test",
+        "-d", config['output_folder'],
         "-f"  # Force regenerate
     ]
 
-    subprocess.run(cmd)
 
-    # 复制结果
-    # 查找正确的 session 目录
-    session_dirs = {
-        'graphviz': 'generate-graphviz-diagrams',
-        'mermaid': 'generate-mermaid-diagrams',
-        'latex': 'generate-latex-diagrams',
-        'matplotlib': 'generate-matplotlib-charts',
-        'plotly': 'generate-plotly-charts'
-    }
+def pipeline_command(config):
+    """运行单个管道的命令行"""
+    return (*MAIN_COMMAND, *pipeline_args(config))
+
+
+# 路径中出现以 "_" 开头的目录
+UNDERSCORE_SEP = os.sep + "_"
+
+
+def collect_artifacts(session_path):
+    """
+    一次遍历 session 目录，按文件名分类：generate-code 下的 PNG、generate-data 下的 dataset.json
+    以及所有 HTML。以 "_" 开头的目录中的 PNG/HTML 被跳过（generate-data 中的 dataset.json 除外）
+    """
+    images, datasets, htmls = [], [], []
+    root_len = len(session_path) + 1
+    for dirpath, dirnames, filenames in os.walk(session_path):
+        rel_path = dirpath[root_len:]
+        step_dir = rel_path.split(os.sep, 1)[0] if rel_path else None
+        hidden = rel_path.startswith("_") or UNDERSCORE_SEP in rel_path
+        if step_dir != "generate-data":
+            # 其它目录中只找 PNG/HTML，直接剪掉以 "_" 开头的子目录
+            dirnames[:] = [d for d in dirnames if not d.startswith("_")]
 
-    session_dir_name = session_dirs.get(config['output_dir'], f"generate-{config['output_dir']}")
-    session_path = Path("./session_output") / session_dir_name
+        for name in filenames:
+            if name == "dataset.json" and step_dir == "generate-data":
+                datasets.append(os.path.join(dirpath, name))
+            elif hidden:
+                continue
+            elif name.endswith(".png") and step_dir == "generate-code":
+                images.append(os.path.join(dirpath, name))
+            elif name.endswith(".html"):
+                htmls.append(os.path.join(dirpath, name))
+    return images, datasets, htmls
 
-    if session_path.exists():
-        print(f"Found session directory: {session_path}")
+
+def copy_results(config):
+    """把管道生成的图像、数据和 HTML 复制到 examples/<output_dir>；报告在最后一次性输出"""
+    messages = []
+    # 创建输出目录
+    output_path = os.path.join(examples_dir, config['output_dir'])
+    os.makedirs(output_path, exist_ok=True)
+
+    session_path = config['session_path']
+
+    if os.path.isdir(session_path):
+        messages.append(f"Found session directory: {session_path}")
 
         # 查找生成的图像文件
-        image_count = 0
-        json_count = 0
-        html_count = 0
-
-        # 在 generate-code 子目录中查找生成的文件
-        code_dir = session_path / "generate-code"
-        if code_dir.exists():
-            # 查找 PNG 文件
-            for img_file in code_dir.rglob("*.png"):
-                if not any(part.startswith("_") for part in img_file.parts):
-                    shutil.copy2(img_file, output_path / f"{config['output_dir']}_{image_count+1}.png")
-                    print(f"Copied image: {img_file.name} -> {config['output_dir']}_{image_count+1}.png")
-                    image_count += 1
-
-            # 查找生成的数据
-            data_dir = session_path / "generate-data"
-            if data_dir.exists():
-                for json_file in data_dir.rglob("dataset.json"):
-                    shutil.copy2(json_file, output_path / f"{config['output_dir']}_data.json")
-                    print(f"Copied dataset: {json_file.name}")
-                    json_count += 1
+        image_files, json_files, html_files = collect_artifacts(session_path)
+
+        # 目标文件名的公共部分只拼接一次
+        name_prefix = config['output_dir'] + "_"
+        out_prefix = output_path + os.sep + name_prefix
+
+        # PNG 和 dataset.json 只在存在 generate-code 目录时复制
+        if not os.path.isdir(os.path.join(session_path, "generate-code")):
+            image_files, json_files = [], []
+
+        # PNG 和 HTML 的目标文件互不相同，可以一次性并行复制
+        image_dsts = [f"{out_prefix}{i}.png" for i, _ in enumerate(image_files, start=1)]
+        html_dsts = [f"{out_prefix}{i}.html" for i, _ in enumerate(html_files, start=1)]
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+            list(executor.map(move_or_copy, image_files + html_files, image_dsts + html_dsts))
+
+        # 查找 PNG 文件
+        for i, img_file in enumerate(image_files, start=1):
+            messages.append(f"Copied image: {os.path.basename(img_file)} -> {name_prefix}{i}.png")
+
+        # 查找生成的数据（都写到同一个目标文件，按顺序复制）
+        data_dst = out_prefix + "data.json"
+        for json_file in json_files:
+            move_or_copy(json_file, data_dst)
+            messages.append(f"Copied dataset: {os.path.basename(json_file)}")
 
         # 查找 HTML 文件
-        for html_file in session_path.rglob("*.html"):
-            if not any(part.startswith("_") for part in html_file.parts):
-                shutil.copy2(html_file, output_path / f"{config['output_dir']}_{html_count+1}.html")
-                print(f"Copied HTML: {html_file.name}")
-                html_count += 1
+        for html_file in html_files:
+            messages.append(f"Copied HTML: {os.path.basename(html_file)}")
 
+        image_count, json_count, html_count = len(image_files), len(json_files), len(html_files)
         if image_count > 0 or json_count > 0 or html_count > 0:
-            print(f"✅ Copied {image_count} images, {json_count} datasets, {html_count} HTML files to {output_path}")
+            messages.append(f"✅ Copied {image_count} images, {json_count} datasets, {html_count} HTML files to {output_path}")
         else:
-            print(f"⚠️  No generated files found in {session_path}")
+            messages.append(f"⚠️  No generated files found in {session_path}")
     else:
-        print(f"⚠️  Session directory not found: {session_path}")
+        messages.append(f"⚠️  Session directory not found: {session_path}")
+
+    sys.stdout.write("\n".join(messages) + "\n")
+    sys.stdout.flush()
+
+
+def run_pipelines(configs):
+    """
+    同时启动所有管道（各自独立的进程、写入各自的 session 目录），在一个 select 循环里
+    实时转发各子进程的输出（每行加上管道前缀）；某个管道结束后立即复制它的结果
+    """
+    selector = selectors.DefaultSelector()
+    for config in configs:
+        process = subprocess.Popen(pipeline_command(config), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # data: (配置, 进程, 尚未凑成整行的输出)
+        selector.register(process.stdout, selectors.EVENT_READ, (config, process, [b""]))
+
+    while selector.get_map():
+        for key, _ in selector.select():
+            config, process, pending = key.data
+            prefix = f"[{config['output_dir']}] "
+            chunk = os.read(key.fd, 65536)
+            if chunk:
+                lines = (pending[0] + chunk).split(b"\n")
+                pending[0] = lines.pop()
+                if lines:
+                    # 一次读到的所有整行一起输出
+                    sys.stdout.write("".join(prefix + line.decode(errors="replace") + "\n" for line in lines))
+                    sys.stdout.flush()
+                continue
+
+            # EOF：子进程已关闭输出
+            if pending[0]:
+                print(prefix + pending[0].decode(errors="replace"))
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+            returncode = process.wait()
+
+            print(f"\n{'='*50}\nFinished {config['pipeline']} (exit code {returncode})\n{'='*50}")
+
+            # 复制结果
+            copy_results(config)
+    selector.close()
+
+
+def run_pipelines_in_worker(configs):
+    """在一个常驻的 main.py --server 进程中依次运行所有管道，每个管道结束后复制它的结果"""
+    worker = subprocess.Popen(
+        (*MAIN_COMMAND, "--server"),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    with worker:
+        for config in configs:
+            worker.stdin.write(json.dumps(pipeline_args(config)) + "\n")
+            worker.stdin.flush()
+
+            prefix = f"[{config['output_dir']}] "
+            # main.py 在标记前多输出一个换行，紧挨着标记的空行不打印
+            held_blank = False
+            for line in worker.stdout:
+                if line.strip() == WORKER_DONE:
+                    break
+                if held_blank:
+                    print(prefix)
+                held_blank = line == "\n"
+                if not held_blank:
+                    print(prefix + line, end="")
+            else:
+                # 输出结束但没有收到标记：worker 已退出（例如配置校验失败）
+                print(f"⚠️  Pipeline worker exited with code {worker.wait()}")
+                break
+
+            print(f"\n{'='*50}\nFinished {config['pipeline']}\n{'='*50}")
+
+            # 复制结果
+            copy_results(config)
+
+
+# 运行测试
+if PIPELINE_WORKER:
+    run_pipelines_in_worker(test_configs)
+else:
+    run_pipelines(test_configs)
+
+# 等待旧缓存删除完成（守护线程会随进程退出而中断）
+if cache_cleaner is not None:
+    cache_cleaner.join()
 
 print("\n✅ All tests completed successfully!")
 
@@ -0,0 +1,8 @@
+"""
+Line protocol shared by main.py --server and test_pipelines.py.
+
+Kept free of heavy imports so the test runner can import it without loading the pipelines.
+"""
+
+# Printed on its own line after each request in --server mode
+WORKER_DONE = "__PIPELINE_DONE__"